@@ -4,31 +4,34 @@ from pathlib import Path
 from jinja2 import Environment, PackageLoader, FileSystemLoader
 #from sanic import Blueprint, response
 #from swagger_ui_bundle import swagger_ui_3_path
-from bl_lookup.bl import generate_bl_map, default_version
-
-Path('swagger_ui').mkdir(exist_ok=True)
-# build OpenAPI schema
-env = Environment(
-    loader=PackageLoader('bl_lookup', 'templates')
-)
-template = env.get_template('openapi.yml')
-server_root = os.environ.get('SERVER_ROOT', "")
-spec_string = template.render()
-# replace the version with the specified default
-spec_string = spec_string.replace('~default version~', default_version)
-
-# replace the server root specification
-spec_string = spec_string.replace('~server root~', server_root)
-
-# replace the x-maturity with the specified default
-spec_string = spec_string.replace('~x maturity~', os.environ.get("MATURITY_VALUE", "production"))
-
-# replace the x-maturity with the specified default
-spec_string = spec_string.replace('~location~', os.environ.get("LOCATION_VALUE", "RENCI"))
-
-swagger_yml='swagger_ui/openapix.yml'
-with open(swagger_yml, 'w') as f:
-    f.write(spec_string)
+from bl_lookup.bl import default_version
+
+
+def build_apidocs():
+    """Render the OpenAPI spec template into swagger_ui/."""
+    Path('swagger_ui').mkdir(exist_ok=True)
+    # build OpenAPI schema
+    env = Environment(
+        loader=PackageLoader('bl_lookup', 'templates')
+    )
+    template = env.get_template('openapi.yml')
+    server_root = os.environ.get('SERVER_ROOT', "")
+    spec_string = template.render()
+    # replace the version with the specified default
+    spec_string = spec_string.replace('~default version~', default_version)
+
+    # replace the server root specification
+    spec_string = spec_string.replace('~server root~', server_root)
+
+    # replace the x-maturity with the specified default
+    spec_string = spec_string.replace('~x maturity~', os.environ.get("MATURITY_VALUE", "production"))
+
+    # replace the x-maturity with the specified default
+    spec_string = spec_string.replace('~location~', os.environ.get("LOCATION_VALUE", "RENCI"))
+
+    swagger_yml='swagger_ui/openapix.yml'
+    with open(swagger_yml, 'w') as f:
+        f.write(spec_string)
 
 #blueprint = Blueprint('apidocs', url_prefix='/apidocs', strict_slashes=True)
 #
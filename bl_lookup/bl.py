@@ -1,11 +1,15 @@
 import os
-import requests
+import json
+import logging
 import typing
 from collections import defaultdict
-from bmt import Toolkit
 from jsonasobj import as_dict
 from copy import deepcopy
 import yaml
+from bl_lookup.geneology import Geneology
+from bl_lookup.http_cache import fetch, fetch_path
+
+logger = logging.getLogger(__name__)
 
 # set the default version for the UI and web service calls
 default_version = os.environ.get('DEFAULT_VERSION', "v3.1.1")
@@ -22,21 +26,15 @@ def get_latest_bl_model_release_url() -> str:
 
     :return: string, the complete URL for the raw repo data
     """
-    response: requests.Response = requests.get('https://api.github.com/repos/biolink/biolink-model/releases/latest')
-
-    # was it a good response
-    if response.status_code == 200:
-        # get the response
-        result: dict = response.json()
+    # get the response, revalidated against the local cache
+    result: dict = json.loads(fetch('https://api.github.com/repos/biolink/biolink-model/releases/latest'))
 
-        # get the tag name
-        if 'tag_name' in result and len(result['tag_name']) > 0:
-            # compile the entire URL
-            return f"https://raw.githubusercontent.com/biolink/biolink-model/{result['tag_name']}/biolink-model.yaml"
-        else:
-            raise Exception('Tag name not found in github data.')
+    # get the tag name
+    if 'tag_name' in result and len(result['tag_name']) > 0:
+        # compile the entire URL
+        return f"https://raw.githubusercontent.com/biolink/biolink-model/{result['tag_name']}/biolink-model.yaml"
     else:
-        raise Exception('Github API response error.')
+        raise Exception('Tag name not found in github data.')
 
 
 models = {
@@ -55,7 +53,7 @@ models = {
     '2.0.2': 'https://raw.githubusercontent.com/biolink/biolink-model/2.0.2/biolink-model.yaml',
     '2.1.0': 'https://raw.githubusercontent.com/biolink/biolink-model/2.1.0/biolink-model.yaml',
     '2.2.3': 'https://raw.githubusercontent.com/biolink/biolink-model/2.2.3/biolink-model.yaml',
-    'latest': get_latest_bl_model_release_url()
+    # 'latest' is looked up from GitHub by get_models()
 }
 
 mappings = { }
@@ -63,51 +61,93 @@ mappings = { }
 # flag to indicate that the biolink models have been loaded
 models_loaded = False
 
+def fetch_models() -> (dict,dict):
+    """
+    gets the biolink model versions from GitHub. raises an Exception if they can't be fetched
+
+    :return: a dict of the released versions to their model urls, and a dict of their predicate mapping urls
+    """
+    # get all the biolink model versions
+    # by default github releases returns 30
+    response: bytes = fetch('https://api.github.com/repos/biolink/biolink-model/releases?per_page=100')
+
+    # did we get the model versions
+    if not response:
+        raise Exception('No releases found in github data.')
+
+    # get the response
+    result: dict = json.loads(response)
+
+    new_models = {}
+    new_mappings = {}
+
+    # for each model version
+    for item in result:
+        # get the version number
+        version = item['html_url'].split('/')[-1]
+
+        # is this one that we want
+        if version not in skip_versions:
+            # save the version in the dict
+            new_models.update({version: f'https://raw.githubusercontent.com/biolink/biolink-model/{version}/biolink-model.yaml'})
+            if version.startswith('v') and version[1] != '.' and int(version[1]) > 2:
+                #This is what we really want, but there's a bit of bugs in 3.1.0 so until 3.1.1 we're gonna use mine
+                #See the "latest" below as well
+                new_mappings.update({version: f'https://raw.githubusercontent.com/biolink/biolink-model/{version}/predicate_mapping.yaml'})
+                #mappings.update({version: f'https://raw.githubusercontent.com/biolink/biolink-model/response/predicate_mapping.yaml'})
+
+    # tack on the latest version
+    new_models.update({'latest': get_latest_bl_model_release_url()})
+    #mappings.update({'latest': models['latest'].replace("biolink-model.yaml", "predicate_mapping.yaml")})
+    new_mappings.update( {"latest": f'https://raw.githubusercontent.com/biolink/biolink-model/latest/predicate_mapping.yaml'})
+
+    return new_models, new_mappings
+
+
+def swap_models(new_models, new_mappings):
+    """
+    replaces the known versions with a freshly fetched list, in place so anything holding the dicts sees it
+    """
+    global models_loaded
+
+    # add and update first, then take out the versions that are gone, so a reader never sees a half filled list
+    for known, new in ((models, new_models), (mappings, new_mappings)):
+        known.update(new)
+        for version in [version for version in known if version not in new]:
+            del known[version]
+
+    # set flag so this is not done again
+    models_loaded = True
+
+
 def get_models() -> (dict,dict):
     """
     gets the biolink model versions
 
     :return: a dict of the available versions
     """
-    # get the flag that indicates we already loaded the model versions
-    global models_loaded
-
     # do we need to get the model versions
     if not models_loaded:
-        # get all the biolink model versions
-        # by default github releases returns 30
-        response: requests.Response = requests.get('https://api.github.com/repos/biolink/biolink-model/releases?per_page=100')
-
-        # did we get the model versions
-        if response.status_code == 200:
-            # set flag so this is not done again
-            models_loaded = True
-
-            # get the response
-            result: dict = response.json()
-
-            # clear out any thing already saved
-            models.clear()
-
-            # for each model version
-            for item in result:
-                # get the version number
-                version = item['html_url'].split('/')[-1]
-
-                # is this one that we want
-                if version not in skip_versions:
-                    # save the version in the dict
-                    models.update({version: f'https://raw.githubusercontent.com/biolink/biolink-model/{version}/biolink-model.yaml'})
-                    if version.startswith('v') and version[1] != '.' and int(version[1]) > 2:
-                        #This is what we really want, but there's a bit of bugs in 3.1.0 so until 3.1.1 we're gonna use mine
-                        #See the "latest" below as well
-                        mappings.update({version: f'https://raw.githubusercontent.com/biolink/biolink-model/{version}/predicate_mapping.yaml'})
-                        #mappings.update({version: f'https://raw.githubusercontent.com/biolink/biolink-model/response/predicate_mapping.yaml'})
-
-            # tack on the latest version
-            models.update({'latest': get_latest_bl_model_release_url()})
-            #mappings.update({'latest': models['latest'].replace("biolink-model.yaml", "predicate_mapping.yaml")})
-            mappings.update( {"latest": f'https://raw.githubusercontent.com/biolink/biolink-model/latest/predicate_mapping.yaml'})
+        swap_models(*fetch_models())
+
+    return models, mappings
+
+
+def refresh_models() -> (dict,dict):
+    """
+    gets the biolink model versions again, to pick up new releases and where 'latest' points.
+    if they can't be fetched the known versions are kept and the error is raised
+
+    :return: a dict of the available versions, and a dict of their predicate mappings
+    """
+    try:
+        new_models, new_mappings = fetch_models()
+    except Exception as e:
+        logger.error(f"Could not refresh the biolink model releases, keeping the {len(models)} known versions: {e!r}")
+        raise
+
+    swap_models(new_models, new_mappings)
+
     return models, mappings
 
 
@@ -145,15 +185,6 @@ class bmt_wrapper():
     def __init__(self, bmt):
         self.bmt = bmt
 
-    def name_to_uri(self, name):
-        element = self.bmt.get_element(name)
-        if element is None:
-            print('?', element)
-        try:
-            return element['slot_uri']
-        except:
-            return element['class_uri']
-
     def get_element(self, name):
         element = as_dict(self.bmt.get_element(name))
         # This value is not Json serializable, so we're removing it for now.
@@ -182,73 +213,408 @@ class bmt_wrapper():
                     tag = 'biolink:' + tag
                 element[tag] = v['value']
             del element['annotations']
+        # biolink 4 alt_descriptions are AltDescription objects, also not JSON serializable
+        if 'alt_descriptions' in element:
+            element['alt_descriptions'] = {
+                k: {'source': v.source, 'description': v.description} if hasattr(v, 'description') else v
+                for k, v in element['alt_descriptions'].items()
+            }
         return element
 
-    def get_descendants(self, name):
-        elements = self.bmt.get_descendants(name)
-        return self.filter(elements)
+
+class ElementTable():
+    """
+    Every element of the model, converted once into its final JSON-safe form.
+
+    Materializing an element (as_dict, flattening the annotations) is the slow part of
+    bmt_wrapper.get_element, and the maps used to do it for raw, again for the uri map and
+    again for every element in the schema while looking for mixins. The builders read the
+    elements, their uris and the mixin list from here instead.
+    """
+
+    def __init__(self, bmt):
+        self.bmt = bmt
+        self.elements = {}
+        self.uris = {}
+        self.mixins = []
+
+        for name in bmt.bmt.get_all_elements():
+            try:
+                element = self.get_element(name)
+            except Exception:
+                continue
+
+            if element is not None and element.get('mixin'):
+                self.mixins.append(name)
+
+    def get_element(self, name):
+        """
+        gets the materialized element, converting it the first time it is asked for
+
+        :param name: the name or alias of the element
+        :return: the element as a dict, or None if there is no such element
+        """
+        if name not in self.elements:
+            element = None
+
+            if self.bmt.bmt.get_element(name) is not None:
+                element = self.bmt.get_element(name)
+
+            self.elements[name] = element
+
+            # a slot's uri, otherwise a class's
+            if element is None:
+                self.uris[name] = None
+            elif 'slot_uri' in element:
+                self.uris[name] = element['slot_uri']
+            else:
+                self.uris[name] = element.get('class_uri')
+
+        return self.elements[name]
+
+    def name_to_uri(self, name):
+        self.get_element(name)
+        return self.uris[name]
+
+
+class ElementGraph():
+    """
+    The is_a + mixin graph of a model, pulled out of BMT once.
+
+    BMT answers every get_ancestors / get_descendants call with a fresh walk, and finding
+    the children of an element means scanning every class or slot, so building the geneology
+    element by element costs thousands of walks per version. Here the edges are extracted in
+    one pass and every closure is a walk over plain dicts. The walk is the same depth first
+    traversal linkml uses, so the results come out in the same order as BMT's.
+    """
+
+    def __init__(self, bmt, table):
+        self.bmt = bmt
+        self.table = table
+        view = bmt.bmt.view
+
+        self.parents = {}
+        self.children = defaultdict(list)
+        self.is_class = {}
+
+        for is_class, definitions in ((True, view.all_classes()), (False, view.all_slots())):
+            for name, definition in definitions.items():
+                # linkml lists the mixins first
+                parents = list(definition.mixins)
+                if definition.is_a is not None:
+                    parents.append(definition.is_a)
+
+                self.parents[name] = parents
+                self.is_class.setdefault(name, is_class)
+
+                # each child is listed once per parent, in schema order
+                for parent in dict.fromkeys(parents):
+                    self.children[(is_class, parent)].append(name)
+
+        # BMT leaves out slots that only exist as aliases, like gene_to_gene_association_subject
+        from linkml_runtime.linkml_model.meta import SlotDefinition
+        self.secondary = {
+            name for name in self.parents
+            if isinstance(view.get_element(name), SlotDefinition) and view.get_element(name).alias
+        }
+
+    def is_valid(self, name):
+        """Leaves out bogus names like 'molecular activity_has output' and elements BMT can't find."""
+        return '_' not in name and self.table.get_element(name) is not None
+
+    def _closure(self, name, edges):
+        result = [name]
+        seen = {name}
+        todo = [name]
+        while todo:
+            for v in edges(todo.pop()):
+                if v not in seen:
+                    seen.add(v)
+                    todo.append(v)
+                    result.append(v)
+        return result
+
+    def _walk(self, name, up):
+        element = self.bmt.bmt.get_element(name)
+        if element is None:
+            if up:
+                return []
+            raise ValueError("not a valid biolink component")
+
+        name = element.name
+        if name not in self.is_class:
+            # types and enums have no lineage here
+            return []
+
+        is_class = self.is_class[name]
+        if up:
+            elements = self._closure(name, lambda x: self.parents.get(x, []))
+        else:
+            elements = self._closure(name, lambda x: self.children.get((is_class, x), []))
+
+        if not is_class:
+            elements = [e for e in elements if e not in self.secondary]
+
+        return [e for e in elements if self.is_valid(e)]
 
     def get_ancestors(self, name):
-        elements = self.bmt.get_ancestors(name)
-        return self.filter(elements)
-
-    def filter(self, elements):
-        # bmt 0.3.0 has a bug that is letting in some bogus terms like 'molecular activity_has output'
-        elements = list(filter(lambda x: not '_' in x, elements))
-        # bmt 0.3.0 also has a bug where it it can't find some valid classes:
-        elements = list(filter(lambda x: self.bmt.get_element(x) is not None, elements))
-        return elements
-
-
-def get_all_mixins(bmt):
-    tk = bmt.bmt
-    all_elements = tk.get_all_elements()
-    mixins = []
-    for element in all_elements:
+        return self._walk(name, True)
+
+    def get_descendants(self, name):
+        return self._walk(name, False)
+
+
+def load_toolkit(url):
+    """
+    loads a BMT toolkit for a model yaml through the local cache
+
+    Toolkit() also downloads BMT's own predicate and infores maps with requests directly, so
+    they can't go through the cache. Nothing here uses them, so only the schema view is set up,
+    which keeps offline mode working. This relies on the attributes bmt 1.0.14 sets, which is
+    why requirements.txt pins it and test_geneology checks them.
+
+    :param url: the url or path of the biolink-model.yaml
+    :return: the toolkit
+    """
+    # BMT takes seconds to import, so only pay for it when a model is actually built
+    from bmt import Toolkit
+    from linkml_runtime.utils.schemaview import SchemaView
+
+    if url.startswith('http'):
+        url = fetch_path(url)
+
+    toolkit = Toolkit.__new__(Toolkit)
+    toolkit.view = SchemaView(url)
+    toolkit.pmap = {}
+    toolkit.infores_map = {}
+
+    return toolkit
+
+
+# what a predicate resolves to when nothing better is found
+RELATED_TO = {
+    'predicate': 'biolink:related_to',
+    'label': 'related to',
+    'inverted': False
+}
+
+
+def resolve_predicate_entry(raw, concept, mapping, version) -> dict:
+    """
+    works out what a biolink predicate resolves to. raises a KeyError if the concept
+    is not a predicate, in which case it resolves to related to
+
+    :param raw: the raw element records of the version
+    :param concept: the key_case name of the predicate
+    :param mapping: the mapping the predicate was found through, {} if there is none
+    :param version: the biolink model version
+    :return: the predicate, label, inverted flag and qualifiers
+    """
+    # get the concept properties
+    props = raw[concept]
+
+    # was there a result
+    if len(props) == 0:
+        raise KeyError
+
+    #We might need to invert the predicate though
+    # There are no canonical directions in biolink before 2.0
+    major_version = version.split('.')[0]
+    if major_version == '1':
+        inverted = False
+    else:
+        #can't invert a symmetric property
+        sym = props['symmetric']
+        if (sym is not None) and sym:
+            inverted = False
+        elif props['inverse'] is None:
+            #Can't invert something with no inverse.
+            inverted = False
+        else:
+            #annots = props['annotations']
+            if 'biolink:canonical_predicate' in props and props['biolink:canonical_predicate'].upper() == 'TRUE':
+                #this is the canonical direction, all good
+                inverted = False
+            else:
+                #this is not the canonical direction, and it's not symmetric, we need to flip it (flip it good).
+                newconcept = key_case(props['inverse'])
+                iprops = raw[newconcept]
+                if 'biolink:canonical_predicate' in iprops and iprops['biolink:canonical_predicate'].upper() == 'TRUE':
+                    inverted = True
+                    props = iprops
+                else:
+                    #neither is claimed as being canonical; just leave it alone
+                    inverted = False
+
+    entry = {
+        'predicate': props['slot_uri'],
+        'label': props['name'],
+        'inverted': inverted
+    }
+
+    for k, v in mapping.items():
+        if k == 'predicate':
+            continue
+        sc = '_'.join(v.split())
+        if k in ['predicate', 'qualified predicate']:
+            if not sc.startswith('biolink'):
+                sc = f"biolink:{sc}"
+        sk = '_'.join(k.split())
+        entry[sk] = sc
+
+    return entry
+
+
+def build_resolution_table(raw, uri_map, version) -> dict:
+    """
+    resolves every mapped uri and every predicate name ahead of time
+
+    :param raw: the raw element records of the version
+    :param uri_map: the uri map of the version
+    :param version: the biolink model version
+    :return: a dict with the entries for each uri under 'uris', and for each key_case name under 'concepts'
+    """
+    uris = {}
+
+    for uri, mappings in uri_map.items():
+        if len(mappings) == 0:
+            continue
+
+        mapping = mappings[0]['mapping']
+
+        # anything that does not resolve cleanly is left to be worked out, and fail, per request
+        try:
+            concept = key_case(mapping['predicate'])
+        except Exception:
+            continue
+
         try:
-            if bmt.get_element(element)['mixin']:
-                mixins.append(element)
-        except:
-            pass
-    return mixins
+            uris[uri] = resolve_predicate_entry(raw, concept, mapping, version)
+        except KeyError:
+            uris[uri] = dict(RELATED_TO)
+        except Exception:
+            continue
+
+    concepts = {}
+
+    for concept in raw:
+        try:
+            concepts[concept] = resolve_predicate_entry(raw, concept, {}, version)
+        except Exception:
+            continue
+
+    return {'uris': uris, 'concepts': concepts}
+
+
+BIOLINK_PREFIX = 'biolink:'
+BIOLINK_IRI = 'https://w3id.org/biolink/vocab/'
+
+
+def get_spellings(record) -> list:
+    """
+    lists the ways a client may refer to an element, most authoritative first
+
+    :param record: the raw element record
+    :return: a list of (rank, spelling), rank 0 for the names and uris, 1 for declared aliases and 2 for exact mappings
+    """
+    name = record['name']
+    snake = name.replace(' ', '_')
+    # 'RNA product' is RNAProduct, so only the first letter of each word changes
+    camel = ''.join(word[:1].upper() + word[1:] for word in name.split(' '))
+
+    names = [name, snake, camel]
+    names += [BIOLINK_PREFIX + local for local in (snake, camel)]
+    names += [BIOLINK_IRI + local for local in (snake, camel)]
+
+    for uri in (record.get('class_uri'), record.get('slot_uri')):
+        if uri:
+            names.append(uri)
+
+            if uri.startswith(BIOLINK_PREFIX):
+                names.append(BIOLINK_IRI + uri[len(BIOLINK_PREFIX):])
+
+    return [(0, spelling) for spelling in names] \
+        + [(1, spelling) for spelling in record.get('aliases') or []] \
+        + [(2, spelling) for spelling in record.get('exact_mappings') or []]
+
+
+def build_alias_index(raw) -> (dict, dict):
+    """
+    maps every accepted spelling of every element to its key, so looking a concept up
+    needs no rewriting of the name it was asked for by.
+
+    a spelling claimed by several elements goes to the one it names most directly, a name
+    over an alias over a mapping. if that still leaves more than one, it is ambiguous and
+    left out.
+
+    :param raw: the raw element records of the version
+    :return: a dict of spelling to element key, and a dict of each ambiguous spelling to the keys claiming it
+    """
+    # spelling -> (rank, [keys])
+    claims = {}
+
+    for key, record in raw.items():
+        claims[key] = (-1, [key])
+
+        for rank, spelling in get_spellings(record):
+            if not isinstance(spelling, str):
+                continue
+
+            best = claims.get(spelling)
+
+            if best is None or rank < best[0]:
+                claims[spelling] = (rank, [key])
+            elif rank == best[0] and key not in best[1]:
+                best[1].append(key)
+
+    index = {}
+    collisions = {}
+
+    for spelling, (rank, keys) in claims.items():
+        if len(keys) == 1:
+            index[spelling] = keys[0]
+        else:
+            collisions[spelling] = keys
 
+    return index, collisions
 
-def generate_bl_map(url=None, version='latest'):
-    """Generate map (dict) from BiolinkModel."""
-    get_models()
 
-    mapping_url = None
+def generate_bl_map(url=None, version='latest', mapping_url=None):
+    """Generate map (dict) from BiolinkModel. Given a url, the release list isn't needed."""
     if url is None:
+        get_models()
         url = models[version]
         if version in mappings:
             mapping_url = mappings[version]
-    bmt = bmt_wrapper(Toolkit(url))
+    bmt = bmt_wrapper(load_toolkit(url))
     if mapping_url is None:
         pmaps = []
     else:
-        pr = yaml.safe_load(requests.get(mapping_url).content)
+        pr = yaml.safe_load(fetch(mapping_url))
         if 'predicate mappings' not in pr:
             print(pr)
         pmaps = pr['predicate mappings']
-    elements = bmt.get_descendants('related to') + bmt.get_descendants('association') + bmt.get_descendants('named thing') \
-               + ['named thing', 'related to', 'association'] + get_all_mixins(bmt)
+    table = ElementTable(bmt)
+    graph = ElementGraph(bmt, table)
+    elements = graph.get_descendants('related to') + graph.get_descendants('association') + graph.get_descendants('named thing') \
+               + ['named thing', 'related to', 'association'] + table.mixins
     geneology = {
         key_case(entity_type): {
-            'ancestors': [bmt.name_to_uri(a) for a in bmt.get_ancestors(entity_type) if a != entity_type],
-            'descendants': [bmt.name_to_uri(a) for a in bmt.get_descendants(entity_type)],
+            'ancestors': [table.name_to_uri(a) for a in graph.get_ancestors(entity_type) if a != entity_type],
+            'descendants': [table.name_to_uri(a) for a in graph.get_descendants(entity_type)],
         }
         for entity_type in elements
     }
-    for entity_type, ancestors_and_descendants in geneology.items():
-        geneology[entity_type]['lineage'] = ancestors_and_descendants['ancestors'] + ancestors_and_descendants['descendants']
+    # keep it compact, the lineage is put together from the ancestors and descendants when asked for
+    geneology = Geneology.from_lists(geneology)
     raw = {
-        key_case(key): bmt.get_element(key)
+        key_case(key): table.get_element(key)
         for key in elements
     }
 
     #The URL map in biolink 3 is a little fishy.   Right now, there are
     inverse_uri_map = {
-        bmt.name_to_uri(key): bmt.get_element(key)
+        table.name_to_uri(key): table.get_element(key)
         for key in elements
     }
     uri_map = defaultdict(list)
@@ -288,7 +654,11 @@ def generate_bl_map(url=None, version='latest'):
     data = {
         'geneology': geneology,
         'raw': raw,
+        # so resolving a known predicate is a single lookup
+        'resolution': build_resolution_table(raw, uri_map, version),
     }
+    # so any spelling of a concept is a single lookup
+    data['aliases'], data['alias_collisions'] = build_alias_index(raw)
     return data, uri_map
 
 
@@ -0,0 +1,135 @@
+"""What changed between two model versions: the elements added and removed, the changes
+to how the kept ones are placed and related, and the changes to the uri mappings.
+"""
+from bl_lookup.bl import key_case
+from bl_lookup.reachability import get_uri
+from bl_lookup.search import get_kinds
+
+# the element properties compared between versions
+FIELDS = ('is_a', 'mixins', 'inverse', 'symmetric', 'canonical', 'deprecated')
+
+
+def get_field(record, field):
+    if field == 'canonical':
+        return str(record.get('biolink:canonical_predicate') or '').upper() == 'TRUE'
+
+    value = record.get(field)
+
+    # an empty list and a missing one are the same thing
+    if field == 'mixins':
+        return list(value or [])
+
+    return value
+
+
+def get_element_kinds(data) -> dict:
+    """
+    :param data: the data of a version
+    :return: a dict of element key to its kinds
+    """
+    geneology = data['geneology']
+    associations = set(geneology['association']['descendants']) if 'association' in geneology else set()
+
+    return {key: get_kinds(record, associations) for key, record in data['raw'].items()}
+
+
+def describe(key, record, kinds) -> dict:
+    return {'uri': get_uri(record), 'name': record['name'], 'kinds': sorted(kinds[key])}
+
+
+def mapped_keys(mappings) -> set:
+    """
+    :param mappings: the uri map entries of one uri
+    :return: the keys of the elements they map to
+    """
+    keys = set()
+
+    for mapping in mappings:
+        try:
+            keys.add(key_case(mapping['mapping']['predicate']))
+        except (KeyError, ValueError, AttributeError):
+            continue
+
+    return keys
+
+
+def diff_versions(from_version, from_data, from_uri_map, to_version, to_data, to_uri_map) -> dict:
+    """
+    compares two versions
+
+    :param from_version: the older biolink model version
+    :param from_data: its data
+    :param from_uri_map: its uri map
+    :param to_version: the newer biolink model version
+    :param to_data: its data
+    :param to_uri_map: its uri map
+    :return: a dict of the added, removed and changed elements, and the added, removed and changed mappings
+    """
+    from_raw, to_raw = from_data['raw'], to_data['raw']
+    kinds = {**get_element_kinds(from_data), **get_element_kinds(to_data)}
+
+    added = [describe(key, to_raw[key], kinds) for key in to_raw if key not in from_raw]
+    removed = [describe(key, from_raw[key], kinds) for key in from_raw if key not in to_raw]
+    changed = []
+
+    for key, record in to_raw.items():
+        old = from_raw.get(key)
+
+        # records that are the same object were shared between the versions, so nothing changed
+        if old is None or old is record:
+            continue
+
+        changes = {}
+
+        for field in FIELDS:
+            before, after = get_field(old, field), get_field(record, field)
+
+            if before != after:
+                changes[field] = {'from': before, 'to': after}
+
+        if changes:
+            changed.append({**describe(key, record, kinds), 'changes': changes})
+
+    def describe_uri(uri, *mapping_lists):
+        keys = set().union(*[mapped_keys(mappings) for mappings in mapping_lists])
+        return {'uri': uri, 'kinds': sorted(set().union(*[kinds[key] for key in keys if key in kinds]))}
+
+    mappings = {'added': [], 'removed': [], 'changed': []}
+
+    for uri, after in to_uri_map.items():
+        before = from_uri_map.get(uri, [])
+
+        if not after or before == after:
+            continue
+
+        if before:
+            mappings['changed'].append({**describe_uri(uri, before, after), 'from': before, 'to': after})
+        else:
+            mappings['added'].append({**describe_uri(uri, after), 'mappings': after})
+
+    for uri, before in from_uri_map.items():
+        if before and not to_uri_map.get(uri):
+            mappings['removed'].append({**describe_uri(uri, before), 'mappings': before})
+
+    return {'from': from_version, 'to': to_version, 'added': added, 'removed': removed, 'changed': changed, 'mappings': mappings}
+
+
+def filter_diff(diff, kind) -> dict:
+    """
+    :param diff: the output of diff_versions
+    :param kind: one of search.KINDS, or None for everything
+    :return: the diff with only the elements and mappings of that kind
+    """
+    if kind is None:
+        return diff
+
+    def keep(items):
+        return [item for item in items if kind in item['kinds']]
+
+    return {
+        **diff,
+        'added': keep(diff['added']),
+        'removed': keep(diff['removed']),
+        'changed': keep(diff['changed']),
+        'mappings': {change: keep(items) for change, items in diff['mappings'].items()},
+    }
@@ -0,0 +1,96 @@
+"""Share identical element records between the resident model versions.
+
+Successive releases define most elements the same way. Each record is hashed on
+its content, and versions holding an identical record share one dict and one
+serialized JSON copy of it (with its compressed variants) instead of keeping their own.
+"""
+import hashlib
+import json
+
+from bl_lookup.responses import encode_json, make_variants
+
+
+def record_digest(record) -> str:
+    """
+    hashes the content of an element record
+
+    :param record: the element record
+    :return: the hex digest
+    """
+    return hashlib.sha256(json.dumps(record, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class ElementStore:
+    """Content addressed element records, reference counted by the versions using them."""
+
+    def __init__(self):
+        # digest -> record, the serialized record and the number of references to it
+        self.records = dict()
+        self.serialized = dict()
+        self.refs = dict()
+
+        # version -> {element key: digest}
+        self.versions = dict()
+
+    def add(self, version, raw) -> (dict, int):
+        """
+        swaps the records of a version for the shared copies, storing the new ones
+
+        :param version: the biolink model version
+        :param raw: the element key to record dict of the version
+        :return: the shared raw dict, and the number of serialized bytes that were already stored
+        """
+        self.remove(version)
+
+        shared = dict()
+        digests = dict()
+        reused = 0
+
+        for key, record in raw.items():
+            digest = record_digest(record)
+
+            if digest in self.records:
+                reused += sum(len(body) for body in self.serialized[digest].values())
+            else:
+                self.records[digest] = record
+                self.serialized[digest] = make_variants(encode_json(record))
+                self.refs[digest] = 0
+
+            self.refs[digest] += 1
+            shared[key] = self.records[digest]
+            digests[key] = digest
+
+        self.versions[version] = digests
+
+        return shared, reused
+
+    def remove(self, version):
+        """
+        drops the references of a version, and any records nothing else uses
+
+        :param version: the biolink model version
+        """
+        for digest in self.versions.pop(version, {}).values():
+            self.refs[digest] -= 1
+
+            if self.refs[digest] == 0:
+                del self.records[digest], self.serialized[digest], self.refs[digest]
+
+    def get_serialized(self, version, key) -> bytes:
+        """
+        gets the serialized JSON of an element record
+
+        :param version: the biolink model version
+        :param key: the element key
+        :return: a dict of content coding to JSON bytes
+        """
+        return self.serialized[self.versions[version][key]]
+
+    def stats(self) -> dict:
+        """
+        :return: the number of element references, unique records and the dedup ratio
+        """
+        references = sum(self.refs.values())
+        unique = len(self.records)
+
+        return {'references': references, 'unique': unique, 'ratio': references / unique if unique else 1.0}
@@ -0,0 +1,140 @@
+"""Compact storage for the ancestors and descendants of every element in a version.
+
+Every uri is interned once per version and the closures are kept as arrays of uri ids,
+one flat array per property with an offset per element. The lists the endpoints
+return are decoded on access, and the lineage is put together from the other two.
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+
+PROPERTIES = ('ancestors', 'descendants', 'lineage')
+
+
+def _typecode(count):
+    return 'H' if count <= 0xFFFF else 'I'
+
+
+class Geneology(Mapping):
+    """Maps an element key to its GeneologyRecord."""
+
+    def __init__(self, uris, keys, ancestors, descendants):
+        """
+        :param uris: the interned uris, a uri id is its position in this list
+        :param keys: the element keys, in row order
+        :param ancestors: (offsets, ids) arrays. the ancestors of row i are ids[offsets[i]:offsets[i+1]]
+        :param descendants: (offsets, ids) arrays, like ancestors
+        """
+        self.uris = uris
+        self.index = {key: row for row, key in enumerate(keys)}
+        self.ancestors = ancestors
+        self.descendants = descendants
+
+    @classmethod
+    def from_lists(cls, geneology):
+        """
+        builds the compact form from lists of uris
+
+        :param geneology: a dict of element key to a dict with 'ancestors' and 'descendants' lists
+        :return: the Geneology
+        """
+        uris = []
+        uri_ids = {}
+
+        def intern(uri):
+            if uri not in uri_ids:
+                uri_ids[uri] = len(uris)
+                uris.append(sys.intern(str(uri)) if isinstance(uri, str) else uri)
+            return uri_ids[uri]
+
+        columns = {}
+
+        for prop in ('ancestors', 'descendants'):
+            offsets = [0]
+            ids = []
+
+            for lists in geneology.values():
+                # the endpoints never returned duplicates, so drop them here once
+                ids.extend(dict.fromkeys(intern(uri) for uri in lists[prop]))
+                offsets.append(len(ids))
+
+            columns[prop] = (offsets, ids)
+
+        typecode = _typecode(len(uris))
+
+        return cls(uris, list(geneology.keys()), *[
+            (array('I', offsets), array(typecode, ids)) for offsets, ids in (columns['ancestors'], columns['descendants'])
+        ])
+
+    @classmethod
+    def from_dict(cls, contents):
+        """
+        :param contents: the output of to_dict
+        :return: the Geneology
+        """
+        uris = [sys.intern(uri) if isinstance(uri, str) else uri for uri in contents['uris']]
+        typecode = _typecode(len(uris))
+
+        return cls(uris, contents['keys'], *[
+            (array('I', contents[prop][0]), array(typecode, contents[prop][1])) for prop in ('ancestors', 'descendants')
+        ])
+
+    def to_dict(self) -> dict:
+        """
+        :return: a JSON serializable form of the Geneology
+        """
+        return {
+            'uris': self.uris,
+            'keys': list(self.index),
+            'ancestors': [self.ancestors[0].tolist(), self.ancestors[1].tolist()],
+            'descendants': [self.descendants[0].tolist(), self.descendants[1].tolist()],
+        }
+
+    def ids(self, row, prop):
+        """
+        gets the uri ids of one property of an element
+
+        :param row: the row of the element
+        :param prop: 'ancestors', 'descendants' or 'lineage'
+        :return: the uri ids
+        """
+        if prop == 'lineage':
+            return list(dict.fromkeys(self.ids(row, 'ancestors') + self.ids(row, 'descendants')))
+
+        offsets, ids = self.ancestors if prop == 'ancestors' else self.descendants
+
+        return ids[offsets[row]:offsets[row + 1]].tolist()
+
+    def decode(self, row, prop):
+        uris = self.uris
+        return [uris[i] for i in self.ids(row, prop)]
+
+    def __getitem__(self, key):
+        return GeneologyRecord(self, self.index[key])
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class GeneologyRecord(Mapping):
+    """The ancestors, descendants and lineage of one element, decoded when read."""
+
+    __slots__ = ('geneology', 'row')
+
+    def __init__(self, geneology, row):
+        self.geneology = geneology
+        self.row = row
+
+    def __getitem__(self, prop):
+        if prop not in PROPERTIES:
+            raise KeyError(prop)
+        return self.geneology.decode(self.row, prop)
+
+    def __iter__(self):
+        return iter(PROPERTIES)
+
+    def __len__(self):
+        return len(PROPERTIES)
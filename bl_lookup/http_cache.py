@@ -0,0 +1,196 @@
+"""On-disk cache for the model files and release metadata fetched from GitHub.
+
+Responses are stored by url along with their ETag / Last-Modified headers and
+revalidated with conditional GETs. Files under a release tag never change, so
+those are served from disk without going back to the network at all. In offline
+mode nothing goes to the network and anything not already cached is an error.
+"""
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+import time
+
+import requests
+
+from bl_lookup.util import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# raw files under a release tag like 'v3.1.2' or '2.2.3', as opposed to a branch like 'master' or 'latest'
+IMMUTABLE_URL = re.compile(r'^https://raw\.githubusercontent\.com/[^/]+/[^/]+/v?\d+\.\d+[^/]*/')
+
+
+def is_immutable(url) -> bool:
+    """
+    :param url: the url
+    :return: True if its contents can never change
+    """
+    return IMMUTABLE_URL.match(url) is not None
+
+
+class HTTPCache:
+    """A persistent content cache keyed by url."""
+
+    def __init__(self, cache_dir=None, offline=False, max_age=60, timeout=60):
+        """
+        :param cache_dir: the directory holding the cached responses, None to keep nothing on disk
+        :param offline: never touch the network
+        :param max_age: seconds a revalidated response is reused before checking again
+        :param timeout: seconds to wait for the network
+        """
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else None
+        self.offline = offline
+        self.max_age = max_age
+        self.timeout = timeout
+
+    def _paths(self, url) -> (pathlib.Path, pathlib.Path):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+        # keep the extension so loaders that look at it still work
+        suffix = pathlib.PurePosixPath(url.split('?')[0]).suffix
+
+        return self.cache_dir.joinpath(key + suffix), self.cache_dir.joinpath(key + '.meta')
+
+    def _read_meta(self, url):
+        if self.cache_dir is None:
+            return None
+
+        body_path, meta_path = self._paths(url)
+
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+        return meta if meta.get('url') == url and body_path.exists() else None
+
+    def _write(self, url, meta, body=None):
+        body_path, meta_path = self._paths(url)
+
+        # the body goes first, so the metadata never describes a body that isn't there yet
+        if body is not None:
+            atomic_write(body_path, body)
+
+        atomic_write(meta_path, json.dumps(meta))
+
+    def _refresh(self, url, meta):
+        """
+        makes sure the cached copy of a url is current
+
+        :param url: the url
+        :param meta: the metadata of the cached copy, or None if there is none
+        """
+        if meta is not None:
+            if self.offline or is_immutable(url):
+                return
+
+            if time.time() - meta.get('checked', 0) < self.max_age:
+                return
+        elif self.offline:
+            raise Exception(f"'{url}' is not cached and offline mode is on.")
+
+        headers = {}
+
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            response = requests.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            # a stale copy is better than nothing
+            if meta is not None:
+                logger.warning(f"Could not revalidate '{url}', using the cached copy: {e}")
+                return
+            raise
+
+        if response.status_code == 304 and meta is not None:
+            meta['checked'] = time.time()
+            self._write(url, meta)
+            return
+
+        if response.status_code != 200:
+            # rate limited or the server is having trouble, the stale copy will do
+            if meta is not None:
+                logger.warning(f"Could not revalidate '{url}', using the cached copy: response error {response.status_code}")
+                return
+            raise Exception(f"Response error {response.status_code} for '{url}'.")
+
+        self._write(url, {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked': time.time(),
+        }, response.content)
+
+    def fetch(self, url) -> bytes:
+        """
+        gets the contents of a url, from the cache if possible
+
+        :param url: the url
+        :return: the response body
+        """
+        if self.cache_dir is None:
+            if self.offline:
+                raise Exception(f"'{url}' is not cached and offline mode is on.")
+
+            response = requests.get(url, timeout=self.timeout)
+
+            if response.status_code != 200:
+                raise Exception(f"Response error {response.status_code} for '{url}'.")
+
+            return response.content
+
+        self._refresh(url, self._read_meta(url))
+
+        return self._paths(url)[0].read_bytes()
+
+    def fetch_path(self, url) -> str:
+        """
+        gets a local file holding the contents of a url, for loaders that want a path
+
+        :param url: the url
+        :return: the path of the cached file, or the url itself if there is no cache
+        """
+        if self.cache_dir is None:
+            if self.offline:
+                raise Exception(f"'{url}' is not cached and offline mode is on.")
+            return url
+
+        self._refresh(url, self._read_meta(url))
+
+        return str(self._paths(url)[0])
+
+
+cache = HTTPCache(os.environ.get('BL_LOOKUP_CACHE_DIR'), os.environ.get('BL_LOOKUP_OFFLINE', '').lower() in ('1', 'true', 'yes'))
+
+
+def configure(cache_dir=None, offline=False):
+    """
+    sets up the shared cache. the settings also go into the environment so worker processes pick them up
+
+    :param cache_dir: the directory holding the cached responses, None to keep nothing on disk
+    :param offline: never touch the network
+    """
+    cache.cache_dir = pathlib.Path(cache_dir) if cache_dir else None
+    cache.offline = offline
+
+    if cache_dir:
+        os.environ['BL_LOOKUP_CACHE_DIR'] = str(cache_dir)
+    else:
+        os.environ.pop('BL_LOOKUP_CACHE_DIR', None)
+
+    os.environ['BL_LOOKUP_OFFLINE'] = 'true' if offline else 'false'
+
+
+def fetch(url) -> bytes:
+    return cache.fetch(url)
+
+
+def fetch_path(url) -> str:
+    return cache.fetch_path(url)
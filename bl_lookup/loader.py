@@ -0,0 +1,30 @@
+"""Build biolink model versions in worker processes."""
+import logging
+import zlib
+
+from bl_lookup.bl import generate_bl_map
+from bl_lookup.snapshot import add_source_digest, dumps, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def build_version(version, sources, snapshot_dir=None) -> bytes:
+    """
+    builds the maps for a version. this runs in a worker process, which gets the urls from
+    the parent so it doesn't need the list of releases
+
+    :param version: the biolink model version
+    :param sources: the model and predicate mapping urls, from snapshot.get_sources
+    :param snapshot_dir: the directory holding the snapshots, or None to skip writing one
+    :return: the maps as compressed snapshot bytes, which are much cheaper to send back than the dicts
+    """
+    data, uri_map = generate_bl_map(url=sources['model'], version=version, mapping_url=sources['mapping'])
+    add_source_digest(version, data, sources)
+
+    if snapshot_dir is not None:
+        try:
+            write_snapshot(snapshot_dir, version, data, uri_map, sources)
+        except OSError as e:
+            logger.warning(f"Could not write snapshot for version '{version}': {e}")
+
+    return zlib.compress(dumps(version, sources, data, uri_map), 1)
@@ -0,0 +1,216 @@
+"""Counters and latency histograms, served in the Prometheus text format.
+
+Recording a sample is a couple of dict and list updates. The text is only put together
+when the metrics are scraped, and values that already live elsewhere, like the sizes
+of the resident versions, are read at that point rather than tracked as they change.
+"""
+import time
+from bisect import bisect_left
+
+# upper bounds in seconds of the latency buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# everything that is rendered, in order
+REGISTRY = []
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra='') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=(), register=True):
+        """
+        :param name: the metric name
+        :param documentation: the HELP text
+        :param labels: the label names
+        :param register: add it to REGISTRY
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+        if register:
+            REGISTRY.append(self)
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> list:
+        return self.header() + self.samples()
+
+
+class Counter(Metric):
+    """A count per set of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=(), register=True):
+        super().__init__(name, documentation, labels, register)
+        self.values = dict()
+
+    def inc(self, *values, amount=1):
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def samples(self) -> list:
+        return [f'{self.name}{format_labels(self.labels, values)} {format_value(value)}' for values, value in self.values.items()]
+
+
+class Histogram(Metric):
+    """Observations per set of label values, counted in buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, register=True):
+        super().__init__(name, documentation, labels, register)
+        self.buckets = tuple(buckets)
+
+        # label values -> [the count in each bucket and over the last one, the sum]
+        self.series = dict()
+
+    def observe(self, value, *values):
+        series = self.series.get(values)
+
+        if series is None:
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        # the bounds are inclusive, so a value on one goes in its bucket
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> list:
+        lines = []
+
+        for values, (counts, total) in self.series.items():
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, values, le)} {cumulative}')
+
+            lines.append(f'{self.name}_sum{format_labels(self.labels, values)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, values)} {cumulative}')
+
+        return lines
+
+
+class Collected(Metric):
+    """Values read when scraped."""
+
+    def __init__(self, name, documentation, labels, collect, kind='gauge', register=True):
+        """
+        :param collect: called with no arguments, returns a dict of label values tuple to value
+        :param kind: gauge, or counter for totals kept somewhere else
+        """
+        super().__init__(name, documentation, labels, register)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self) -> list:
+        return [f'{self.name}{format_labels(self.labels, values)} {format_value(value)}' for values, value in self.collect().items()]
+
+
+def render(registry=None) -> bytes:
+    """
+    :param registry: the metrics to render, REGISTRY if not given
+    :return: the exposition text
+    """
+    lines = []
+
+    for metric in registry if registry is not None else REGISTRY:
+        lines.extend(metric.render())
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+REQUEST_SECONDS = Histogram('bl_lookup_request_duration_seconds', 'Time to answer a request, by route.', ('route', 'method'))
+REQUESTS = Counter('bl_lookup_requests_total', 'Requests answered, by route and status code.', ('route', 'method', 'status'))
+VERSION_REQUESTS = Counter('bl_lookup_version_requests_total', 'Requests for each model version, by the name asked for.', ('version',))
+RESOLUTIONS = Counter('bl_lookup_predicate_resolutions_total',
+                      'Predicates resolved, by how: uri_map, ro_fallback, concept or related_to.', ('outcome',))
+UBERGRAPH_SECONDS = Histogram('bl_lookup_ubergraph_query_duration_seconds', 'Time UberGraph queries took, by query and outcome.',
+                              ('query', 'outcome'))
+VERSION_LOAD_SECONDS = Histogram('bl_lookup_version_load_duration_seconds', 'Time to load or rebuild a version.', ('version',))
+
+
+class Timer:
+    """Observes the time spent in a with block into a histogram, with the outcome as the last label."""
+
+    __slots__ = ('histogram', 'values', 'start')
+
+    def __init__(self, histogram, *values):
+        self.histogram = histogram
+        self.values = values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.values, 'ok' if exc_type is None else 'error')
+
+
+class MetricsMiddleware:
+    """
+    Times every request by the path of the route that answered it. Requests no route
+    matched share one label, so junk paths can't add series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = None
+
+    def route_of(self, scope) -> str:
+        endpoint = scope.get('endpoint')
+
+        if endpoint is None:
+            return 'unmatched'
+
+        # the routes are all added before the first request
+        if self.routes is None:
+            self.routes = {getattr(route, 'endpoint', None): route.path for route in scope['app'].routes}
+
+        return self.routes.get(endpoint, 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = self.route_of(scope)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route, scope['method'])
+            REQUESTS.inc(route, scope['method'], status[0])
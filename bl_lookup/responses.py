@@ -0,0 +1,152 @@
+"""JSON response bodies that are encoded once and revalidated with ETags.
+
+Bodies over a size threshold are also kept gzip compressed, and brotli compressed
+when the brotli module is installed, so clients that accept those get them
+without the server compressing anything per request.
+"""
+import gzip
+import json
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# bodies at least this many bytes long get compressed variants, None for none at all
+compress_threshold = 1024
+
+# the compressed encodings, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def configure(threshold=1024):
+    """
+    :param threshold: the smallest body in bytes to keep compressed variants of, None to never compress
+    """
+    global compress_threshold
+    compress_threshold = threshold
+
+
+def encode_json(content) -> bytes:
+    """
+    encodes content exactly the way JSONResponse does
+
+    :param content: the JSON serializable content
+    :return: the body bytes
+    """
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def make_variants(body) -> dict:
+    """
+    compresses a body if it is big enough to be worth it
+
+    :param body: the encoded JSON body
+    :return: a dict of content coding to body, always with the uncompressed 'identity' one
+    """
+    variants = {'identity': body}
+
+    if compress_threshold is None or len(body) < compress_threshold:
+        return variants
+
+    for encoding in ENCODINGS:
+        if encoding == 'br':
+            compressed = brotli.compress(body)
+        else:
+            # no timestamp, so the bytes only depend on the body
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+
+    return variants
+
+
+def choose_encoding(variants, accept_encoding) -> str:
+    """
+    picks the variant to send
+
+    :param variants: a dict of content coding to body
+    :param accept_encoding: the Accept-Encoding request header, or None
+    :return: the content coding
+    """
+    if not accept_encoding or len(variants) == 1:
+        return 'identity'
+
+    accepted = {}
+
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+
+        accepted[coding.strip().lower()] = q
+
+    best, best_q = 'identity', 0.0
+
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+
+        if encoding in variants and q > best_q:
+            best, best_q = encoding, q
+
+    return best
+
+
+def make_etag(digest) -> str:
+    """
+    :param digest: the content hash of a version
+    :return: a strong ETag, or None if there is no hash
+    """
+    return f'"{digest[:32]}"' if digest else None
+
+
+def etag_matches(etag, if_none_match) -> bool:
+    """
+    :param etag: the ETag of the current response
+    :param if_none_match: the If-None-Match request header, or None
+    :return: True if the client already has this response
+    """
+    if etag is None or not if_none_match:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def json_bytes_response(variants, etag=None, if_none_match=None, accept_encoding=None) -> Response:
+    """
+    sends an encoded JSON body, or 304 Not Modified when the client's copy is current
+
+    :param variants: a dict of content coding to encoded JSON body
+    :param etag: the ETag of the uncompressed body, or None
+    :param if_none_match: the If-None-Match request header, or None
+    :param accept_encoding: the Accept-Encoding request header, or None
+    :return: the response
+    """
+    encoding = choose_encoding(variants, accept_encoding)
+
+    headers = {'Vary': 'Accept-Encoding'}
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+
+        # each representation needs its own strong ETag
+        if etag is not None:
+            etag = f'{etag[:-1]}-{encoding}"'
+
+    if etag is not None:
+        headers['ETag'] = etag
+
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=variants[encoding], status_code=200, media_type='application/json', headers=headers)
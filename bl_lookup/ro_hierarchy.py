@@ -0,0 +1,144 @@
+"""A local copy of the obo property hierarchy, so resolving an RO predicate needs no network.
+
+The direct parents of every obo property are fetched from UberGraph with one bulk
+query and kept in a JSON file between restarts.
+"""
+import json
+import logging
+import pathlib
+import time
+
+from bl_lookup.util import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class PropertyHierarchy:
+    """The direct parents of each property."""
+
+    def __init__(self, parents, source=None, built=None):
+        """
+        :param parents: a dict of property curie to the curies of its direct parents
+        :param source: the SPARQL endpoint the hierarchy came from
+        :param built: when the hierarchy was fetched, in seconds since the epoch
+        """
+        self.parents = parents
+        self.source = source
+        self.built = built
+
+        # the tops of the hierarchy have no parents, but are known all the same
+        self.terms = set(parents).union(*parents.values())
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def __len__(self):
+        return len(self.parents)
+
+    def get_parents(self, term) -> list:
+        return self.parents.get(term, [])
+
+    def find_nearest(self, term, accept):
+        """
+        walks up from a term one level at a time, in the order the parents are listed,
+        and returns the first ancestor that is accepted
+
+        :param term: the property curie
+        :param accept: called with an ancestor curie, True if it is the one
+        :return: the ancestor, or None if none are accepted
+        """
+        seen = {term}
+        level = [term]
+
+        while level:
+            next_level = []
+
+            for child in level:
+                for parent in self.get_parents(child):
+                    if parent in seen:
+                        continue
+
+                    if accept(parent):
+                        return parent
+
+                    seen.add(parent)
+                    next_level.append(parent)
+
+            level = next_level
+
+        return None
+
+    def to_dict(self) -> dict:
+        return {'source': self.source, 'built': self.built, 'parents': self.parents}
+
+    @classmethod
+    def from_dict(cls, contents):
+        return cls(contents['parents'], contents.get('source'), contents.get('built'))
+
+
+def read_hierarchy(path):
+    """
+    :param path: the hierarchy file
+    :return: the PropertyHierarchy, or None if the file is missing or not readable
+    """
+    path = pathlib.Path(path)
+
+    if not path.exists():
+        return None
+
+    try:
+        return PropertyHierarchy.from_dict(json.loads(path.read_text()))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring property hierarchy {path}: {e}")
+        return None
+
+
+def write_hierarchy(path, hierarchy):
+    """
+    :param path: the hierarchy file
+    :param hierarchy: the PropertyHierarchy
+    """
+    atomic_write(path, json.dumps(hierarchy.to_dict()))
+
+
+async def build_hierarchy(ubergraph) -> PropertyHierarchy:
+    """
+    fetches the hierarchy with one bulk query
+
+    :param ubergraph: the UberGraph client
+    :return: the PropertyHierarchy
+    """
+    parents = await ubergraph.get_all_property_parents()
+
+    return PropertyHierarchy(parents, ubergraph.triplestore.hostname, time.time())
+
+
+async def load_hierarchy(path, ubergraph, offline=False):
+    """
+    reads the hierarchy file, fetching and writing it first if there is none
+
+    :param path: the hierarchy file, or None to keep nothing on disk
+    :param ubergraph: the UberGraph client
+    :param offline: never touch the network
+    :return: the PropertyHierarchy, or None if there is no file and it could not be fetched
+    """
+    hierarchy = read_hierarchy(path) if path is not None else None
+
+    if hierarchy is not None or offline:
+        return hierarchy
+
+    try:
+        hierarchy = await build_hierarchy(ubergraph)
+    except Exception as e:
+        logger.error(f"Could not fetch the property hierarchy: {e!r}")
+        return None
+
+    logger.info(f"Fetched the parents of {len(hierarchy)} properties from {hierarchy.source}")
+
+    if path is not None:
+        try:
+            write_hierarchy(path, hierarchy)
+        except OSError as e:
+            logger.warning(f"Could not write the property hierarchy to {path}: {e}")
+
+    return hierarchy
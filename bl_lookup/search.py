@@ -0,0 +1,144 @@
+"""Prefix and infix search over the element names, aliases and uris of a model version.
+
+The spellings are kept lowercased in one sorted list, so the prefix matches of a query are a
+contiguous run found by bisection, and every spelling is also filed under each of its
+trigrams, so the infix matches of a query are checked against the few spellings sharing
+all of its trigrams rather than against all of them.
+"""
+from array import array
+from bisect import bisect_left
+
+# the kinds an element can be searched by
+KINDS = ('class', 'predicate', 'mixin', 'association')
+
+
+def normalize(text) -> str:
+    """
+    :param text: a spelling or a query
+    :return: the form they are compared in, lowercased and with underscores for spaces
+    """
+    return text.lower().replace('_', ' ')
+
+
+def trigrams(text) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def get_kinds(record, associations) -> frozenset:
+    """
+    :param record: the raw element record
+    :param associations: the uris of association and its descendants
+    :return: the kinds of the element
+    """
+    kinds = {'predicate'} if 'slot_uri' in record else {'class'}
+
+    if record.get('mixin'):
+        kinds.add('mixin')
+
+    if record.get('class_uri') in associations:
+        kinds.add('association')
+
+    return frozenset(kinds)
+
+
+class SearchIndex:
+    """The searchable spellings of the elements of one version."""
+
+    def __init__(self, raw, geneology):
+        """
+        :param raw: the raw element records of the version
+        :param geneology: the geneology of the version
+        """
+        associations = set(geneology['association']['descendants']) if 'association' in geneology else set()
+
+        # row -> what is returned for the element, and its kinds
+        self.items = []
+        self.kinds = []
+
+        # spelling id -> normalized spelling, and the row of its element
+        self.spellings = []
+        self.rows = array('I')
+
+        for key, record in raw.items():
+            row = len(self.items)
+            uri = record.get('class_uri') or record.get('slot_uri')
+
+            self.items.append({'name': record['name'], 'uri': uri})
+            self.kinds.append(get_kinds(record, associations))
+
+            for spelling in dict.fromkeys([record['name'], uri, *(record.get('aliases') or [])]):
+                if isinstance(spelling, str):
+                    self.spellings.append(normalize(spelling))
+                    self.rows.append(row)
+
+        # the spellings in sorted order, for the prefix matches
+        order = sorted(range(len(self.spellings)), key=self.spellings.__getitem__)
+        self.sorted_spellings = [self.spellings[i] for i in order]
+        self.sorted_ids = array('I', order)
+
+        # trigram -> the ids of the spellings containing it, in ascending order
+        postings = {}
+
+        for i, spelling in enumerate(self.spellings):
+            for trigram in trigrams(spelling):
+                postings.setdefault(trigram, array('I')).append(i)
+
+        self.trigrams = postings
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query, kind=None, limit=20, infix=True) -> list:
+        """
+        finds the elements with a spelling starting with the query, then those with one containing it
+
+        :param query: the text to look for, in any case
+        :param kind: one of KINDS to only return elements of that kind, or None for all of them
+        :param limit: the most elements to return
+        :param infix: also match the query in the middle of a spelling
+        :return: a list of dicts with the name, uri and kinds of each element, and the spelling that matched
+        """
+        query = normalize(query)
+        results = []
+        found = set()
+
+        def take(i):
+            row = self.rows[i]
+
+            if row in found or (kind is not None and kind not in self.kinds[row]):
+                return
+
+            found.add(row)
+            results.append({**self.items[row], 'kinds': sorted(self.kinds[row]), 'match': self.spellings[i]})
+
+        # the prefix matches are next to each other in sorted order, shortest first
+        start = bisect_left(self.sorted_spellings, query)
+
+        for position in range(start, len(self.sorted_spellings)):
+            if len(results) >= limit or not self.sorted_spellings[position].startswith(query):
+                break
+
+            take(self.sorted_ids[position])
+
+        if not infix or len(results) >= limit:
+            return results[:limit]
+
+        # only spellings holding every trigram of the query can contain it
+        if len(query) >= 3:
+            postings = sorted((self.trigrams.get(trigram, ()) for trigram in trigrams(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = range(len(self.spellings))
+
+        matches = [i for i in candidates if self.rows[i] not in found and query in self.spellings[i]]
+
+        # earlier and tighter matches first
+        matches.sort(key=lambda i: (self.spellings[i].find(query), len(self.spellings[i]), self.spellings[i]))
+
+        for i in matches:
+            if len(results) >= limit:
+                break
+
+            take(i)
+
+        return results
@@ -1,39 +1,318 @@
-from typing import List, Union
-from fastapi import FastAPI, Query
+from typing import List, Optional, Union
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
 import os
 import yaml
 import pathlib
 import json
-
-from bl_lookup.bl import key_case, default_version, get_models, generate_bl_map
+import logging
+import asyncio
+import secrets
+import httpx
+
+from bl_lookup.bl import key_case, default_version, get_models, refresh_models, resolve_predicate_entry, RELATED_TO
+from bl_lookup.versions import VersionManager, VersionPolicy, find_aliases
+from bl_lookup.snapshot import get_source_digest, get_sources
+from bl_lookup.http_cache import configure as configure_http_cache, is_immutable
+from bl_lookup.responses import encode_json, json_bytes_response, make_etag, make_variants, configure as configure_compression
 from urllib.parse import unquote
-from bl_lookup.ubergraph import UberGraph
-from main import args
+from bl_lookup.ubergraph import get_ubergraph, cache_stats, configure as configure_ubergraph, close as close_ubergraph
+from bl_lookup.ro_hierarchy import load_hierarchy
+from bl_lookup.search import SearchIndex, KINDS
+from bl_lookup.reachability import Reachability, get_uri
+from bl_lookup.diff import diff_versions, filter_diff
+from bl_lookup.metrics import Collected, MetricsMiddleware, RESOLUTIONS, VERSION_REQUESTS, CONTENT_TYPE, render
+
+logger = logging.getLogger(__name__)
 
 APP_VERSION = '1.4.1'
 APP = FastAPI(title='Biolink Model Lookup', version=APP_VERSION)
 
-biolink_data = dict()
-biolink_uri_maps = dict()
+# the command line arguments, set by main.py before the server starts
+args = None
+
+def configure(settings):
+    """
+    sets the command line arguments the startup hooks read
+
+    :param settings: the parsed arguments from main.py
+    """
+    global args
+    args = settings
+
+# the resident model versions, loaded on demand
+VERSIONS = VersionManager(pinned=[default_version, 'latest'])
+
+biolink_data = VERSIONS.data
+biolink_uri_maps = VERSIONS.uri_maps
 biolink_qualifier_map = dict()
 
+# the local copy of the RO property hierarchy, None until it is loaded
+ro_hierarchy = None
+ro_hierarchy_task = None
+
+# which releases are served
+version_policy = None
+
+# the task checking for new releases on a schedule, and the check running now
+reload_poller = None
+reload_running = None
+
 @APP.on_event("startup")
 async def load_userdata(models = None):
-    if (args is not None) and (not args == {}) and (args.model is not None):
-        biolink_data[args.model], biolink_uri_maps[args.model] = generate_bl_map(version=args.model)
+    # fetch the model files through the on-disk cache
+    if getattr(args, 'cache_dir', None) or getattr(args, 'offline', False):
+        configure_http_cache(args.cache_dir, args.offline)
+
+    # load from precompiled snapshots when a directory was given
+    VERSIONS.snapshot_dir = getattr(args, 'snapshot_dir', None)
+
+    # the number of processes building versions in parallel
+    VERSIONS.workers = getattr(args, 'workers', None)
+
+    # the client for the RO lookups that fall through to UberGraph
+    configure_ubergraph(timeout=getattr(args, 'sparql_timeout', 10.0), max_concurrency=getattr(args, 'sparql_concurrency', 8),
+                        cache_size=getattr(args, 'sparql_cache_size', 10000), cache_ttl=getattr(args, 'sparql_cache_ttl', 86400))
+
+    # the RO property hierarchy, read from disk or fetched once in the background
+    global ro_hierarchy_task
+    ro_hierarchy_task = asyncio.ensure_future(load_ro_hierarchy(get_ro_hierarchy_path(), getattr(args, 'offline', False)))
+
+    # the smallest response body kept compressed
+    configure_compression(getattr(args, 'compress_threshold', 1024))
+
+    # limits on the resident versions
+    VERSIONS.max_versions = getattr(args, 'max_versions', None)
+    max_memory = getattr(args, 'max_memory', None)
+    VERSIONS.max_bytes = max_memory * 1024 * 1024 if max_memory is not None else None
+
+    global version_policy
+
+    if models is None:
+        models, mappings = get_models()
+        version_policy = VersionPolicy.from_args(args)
     else:
-        if models is None:
-            models, mappings = get_models()
-        for version in models:
-            biolink_data[version], biolink_uri_maps[version] = generate_bl_map(version=version)
+        # only ever serve the versions asked for
+        version_policy = VersionPolicy(list(models))
+
+    versions = version_policy.select(models)
+
+    VERSIONS.available = versions
+
+    await refresh_aliases()
+
+    await preload_versions(versions)
+
+    stats = VERSIONS.elements.stats()
+    logger.info(f"{stats['references']} element records share {stats['unique']} unique ones, a dedup ratio of {stats['ratio']:.2f}")
+
+    # look for new releases every so often
+    global reload_poller
+    reload_interval = getattr(args, 'reload_interval', None)
+    if reload_interval and not getattr(args, 'offline', False):
+        reload_poller = asyncio.ensure_future(poll_releases(reload_interval))
 
     #pmapfile = pathlib.Path(__file__).parent.resolve().joinpath('../resources/predicate_map.json')
     #with open(pmapfile,'r') as inmap:
     #    biolink_qualifier_map.update(json.load(inmap))
 
+async def preload_versions(versions) -> dict:
+    """
+    loads the pinned versions, which take almost all the traffic, up front and all at once.
+    everything else is loaded the first time it is asked for
+
+    :param versions: the versions that may be served
+    :return: a dict of version to error message for the ones that failed
+    """
+    preload = [version for version in versions if version in VERSIONS.pinned]
+
+    results = await asyncio.gather(*[VERSIONS.acquire(version) for version in preload], return_exceptions=True)
+
+    failed = {}
+
+    # a broken version should not take the others down with it
+    for version, result in zip(preload, results):
+        if isinstance(result, Exception):
+            logger.error(f"Version '{version}' is not available: {result}")
+            failed[version] = str(result)
+
+    return failed
+
+def get_ro_hierarchy_path():
+    """
+    :return: the file keeping the RO property hierarchy, or None to only keep it in memory
+    """
+    if getattr(args, 'ro_hierarchy', None):
+        return args.ro_hierarchy
+
+    if getattr(args, 'cache_dir', None):
+        return os.path.join(args.cache_dir, 'ro_hierarchy.json')
+
+    return None
+
+async def load_ro_hierarchy(path, offline=False):
+    global ro_hierarchy
+    hierarchy = await load_hierarchy(path, get_ubergraph(), offline)
+    if hierarchy is not None:
+        ro_hierarchy = hierarchy
+
+async def look_for_aliases(versions):
+    """
+    finds the versions built from the same files, like 'latest' and the release it points at, so they are only loaded once
+
+    :return: a dict of alias to the version it is the same as, or None if they couldn't be worked out
+    """
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, find_aliases, versions, VERSIONS.snapshot_dir)
+    except Exception as e:
+        logger.error(f"Could not look for version aliases: {e!r}")
+        return None
+
+def log_aliases(aliases, before=None):
+    for alias, version in aliases.items():
+        if (before or {}).get(alias) != version:
+            logger.info(f"Version '{alias}' is the same as '{version}'")
+
+async def refresh_aliases():
+    aliases = await look_for_aliases(VERSIONS.available)
+
+    if aliases is not None:
+        log_aliases(aliases)
+        VERSIONS.set_aliases(aliases)
+
+async def reload_versions() -> dict:
+    """
+    picks up new releases, dropped ones, changed sources and a moved 'latest' without a restart.
+    changed versions are rebuilt off the event loop and each is swapped in whole, so a request
+    gets either the old tables or the new ones. checks that overlap share one run
+    """
+    global reload_running
+
+    if reload_running is None or reload_running.done():
+        reload_running = asyncio.ensure_future(_reload_versions())
+
+    return await asyncio.shield(reload_running)
+
+async def _reload_versions() -> dict:
+    loop = asyncio.get_running_loop()
+
+    models, mappings = await loop.run_in_executor(None, refresh_models)
+
+    policy = version_policy or VersionPolicy()
+    versions = policy.select(models)
+    previous = list(VERSIONS.available or [])
+
+    added = [version for version in versions if version not in previous]
+    removed = [version for version in previous if version not in versions]
+
+    # a new release is usually where 'latest' now points. if that can't be worked out, keep the aliases that still apply
+    aliases = await look_for_aliases(versions)
+    if aliases is None:
+        aliases = {alias: version for alias, version in VERSIONS.aliases.items() if alias in versions and version in versions}
+
+    # rebuild the resident versions whose files changed since they were last checked
+    resident = [version for version in VERSIONS.data if version in versions and version not in aliases]
+
+    changed = []
+    to_hash = []
+
+    for version in resident:
+        sources = get_sources(version)
+        built_from = biolink_data[version].get('sources')
+
+        # moved to other urls, so there is nothing to fetch to tell
+        if built_from is not None and built_from != sources:
+            changed.append(version)
+        # the files under a release tag never change, only those on a branch like 'latest' have to be hashed
+        elif not all(is_immutable(url) for url in sources.values() if url):
+            to_hash.append(version)
+
+    digests = await loop.run_in_executor(None, get_digests, to_hash)
+
+    for version in to_hash:
+        if version not in digests:
+            continue
+
+        # a version from an older snapshot doesn't know what it was built from, so take it as current
+        built_from = biolink_data[version].setdefault('source_digest', digests[version])
+
+        if built_from != digests[version]:
+            changed.append(version)
+
+    # load where the aliases in use and the pinned versions now point, so they are ready when the new set is published
+    wanted = [alias for alias in previous if alias in VERSIONS.pinned or VERSIONS.resolve(alias) in VERSIONS.data]
+    wanted += [version for version in VERSIONS.pinned if version in versions]
+    targets = [aliases.get(version, version) for version in dict.fromkeys(wanted) if version in versions]
+    targets = [version for version in dict.fromkeys(targets) if version not in VERSIONS.data and version not in changed]
+
+    for version in changed:
+        logger.info(f"The sources of version '{version}' changed, rebuilding it")
+
+    # everything is built off the event loop first. until it is published requests keep getting the old copies
+    prepared = changed + targets
+
+    results = await asyncio.gather(*[VERSIONS.prepare(version, rebuild=version in changed) for version in prepared],
+                                   return_exceptions=True)
+
+    loaded = {}
+    failed = {}
+
+    for version, result in zip(prepared, results):
+        if isinstance(result, Exception):
+            logger.error(f"Could not {'rebuild' if version in changed else 'load'} version '{version}': {result!r}")
+            failed[version] = str(result) or repr(result)
+        else:
+            loaded[version] = result
+
+    # then the versions, aliases and drops are swapped in together, with nothing awaited in between
+    before = dict(VERSIONS.aliases)
+    VERSIONS.publish(versions, aliases, loaded)
+    log_aliases(VERSIONS.aliases, before)
+
+    if added or removed or changed or before != VERSIONS.aliases:
+        logger.info(f"Reloaded versions: {len(added)} added, {len(removed)} removed, {len(changed)} rebuilt")
+
+    return {'added': added, 'removed': removed, 'rebuilt': [version for version in changed if version not in failed],
+            'aliases': VERSIONS.aliases, 'failed': failed}
+
+def get_digests(versions) -> dict:
+    """
+    hashes the sources of versions, leaving out any that can't be fetched
+    """
+    digests = {}
+
+    for version in versions:
+        try:
+            digests[version] = get_source_digest(version)
+        except Exception as e:
+            logger.warning(f"Could not hash the sources of version '{version}': {e}")
+
+    return digests
+
+async def poll_releases(interval):
+    """
+    checks for new releases every interval seconds, until cancelled
+    """
+    while True:
+        await asyncio.sleep(interval)
+
+        try:
+            await reload_versions()
+        except Exception as e:
+            logger.error(f"Could not check for new releases: {e!r}")
+
+@APP.on_event("shutdown")
+async def unload_userdata():
+    if ro_hierarchy_task is not None:
+        ro_hierarchy_task.cancel()
+    if reload_poller is not None:
+        reload_poller.cancel()
+    VERSIONS.close()
+    await close_ubergraph()
+
 def construct_open_api_schema():
 
     if APP.openapi_schema:
@@ -97,6 +376,8 @@ def construct_open_api_schema():
 
         open_api_schema["servers"] = servers_conf
 
+    APP.openapi_schema = open_api_schema
+
     return open_api_schema
 
 
@@ -108,7 +389,25 @@ APP.add_middleware(
     allow_headers=["*"],
 )
 
-def get_uri_map(version):
+APP.add_middleware(MetricsMiddleware)
+
+# the values kept elsewhere are read when the metrics are scraped
+Collected('bl_lookup_version_size_bytes', 'Approximate size of each resident version.', ('version',),
+          lambda: {(version,): size for version, size in VERSIONS.sizes.items()})
+Collected('bl_lookup_version_elements', 'Elements in each resident version.', ('version',),
+          lambda: {(version,): len(data['raw']) for version, data in VERSIONS.data.items()})
+Collected('bl_lookup_version_last_load_seconds', 'Time the last load or rebuild of each resident version took.', ('version',),
+          lambda: {(version,): seconds for version, seconds in VERSIONS.load_seconds.items()})
+Collected('bl_lookup_element_records', 'Element records referenced by the resident versions, and the unique ones kept.', ('kind',),
+          lambda: {(kind,): VERSIONS.elements.stats()[kind] for kind in ('references', 'unique')})
+Collected('bl_lookup_ubergraph_cache_lookups_total', 'UberGraph parent cache lookups, by cache and result.', ('cache', 'result'),
+          lambda: {(cache, result): stats[result] for cache, stats in cache_stats().items() for result in ('hits', 'misses', 'coalesced')},
+          kind='counter')
+Collected('bl_lookup_ubergraph_cache_entries', 'Entries in each UberGraph parent cache.', ('cache',),
+          lambda: {(cache,): stats['size'] for cache, stats in cache_stats().items()})
+
+async def get_uri_map(version):
+    version = await VERSIONS.acquire(version)
     try:
         uri_map = biolink_uri_maps[version]
         return uri_map
@@ -124,74 +423,354 @@ def get_keys_for_uri(uri_map,uri):
         raise Exception (f"No uri '{uri}'\n")
 
 
-def get_data(version):
+async def get_data(version):
+    requested = version
+    version = await VERSIONS.acquire(version)
+    VERSION_REQUESTS.inc(requested)
     try:
         return biolink_data[version]
     except KeyError:
         raise Exception(f"No version '{version}' available\n")
 
+def get_concept_key(concept,_data):
+    """
+    finds the element a name, curie, iri, alias or exact mapping refers to
+    """
+    key = _data.get('aliases', {}).get(concept)
+    if key is not None:
+        return key
+    # other spellings of a biolink name, like odd spacing or case, are worked out the old way.
+    # a curie with some other prefix only matches if it is a known mapping
+    concept = unquote(concept)
+    prefix, colon, _ = concept.partition(':')
+    key = key_case(concept)
+    if colon and prefix.lower() != 'biolink':
+        raise Exception(f"No '{concept}'\n")
+    return key
+
 def get_concept(concept,_data, datatype='raw'):
-    concept = key_case(unquote(concept))
+    key = get_concept_key(concept,_data)
     try:
-        return _data[datatype][concept]
+        return _data[datatype][key]
     except KeyError:
-        raise Exception(f"No '{concept}'\n")
+        raise Exception(f"No '{key}'\n")
 
 def get_property(key,props,concept):
     try:
-        return list(dict.fromkeys(props[unquote(key)]))
+        return props[unquote(key)]
     except KeyError:
         raise Exception( f"No property '{key}' for concept '{concept}'\n")
 
+def cached_response(version, variants, request):
+    """
+    sends an encoded body with the ETag of its version, or 304 if the client already has it.
+    the client gets a compressed variant if it accepts one
+    """
+    if request is None:
+        return json_bytes_response(variants, VERSIONS.get_etag(version))
+
+    return json_bytes_response(variants, VERSIONS.get_etag(version), request.headers.get('if-none-match'), request.headers.get('accept-encoding'))
+
 @APP.get('/bl/{concept}/ancestors',tags=["lookup"])
-async def lookup_ancestors(concept, version = default_version):
-    return await lookup(concept,'ancestors',version)
+async def lookup_ancestors(concept, request: Request, version = default_version):
+    return await lookup(concept,'ancestors',version,request)
 
 @APP.get('/bl/{concept}/descendants',tags=["lookup"])
-async def lookup_descendants(concept, version = default_version):
-    return await lookup(concept,'descendants',version)
+async def lookup_descendants(concept, request: Request, version = default_version):
+    return await lookup(concept,'descendants',version,request)
 
 @APP.get('/bl/{concept}/lineage',tags=["lookup"])
-async def lookup_lineage(concept, version = default_version):
-    return await lookup(concept,'lineage',version)
+async def lookup_lineage(concept, request: Request, version = default_version):
+    return await lookup(concept,'lineage',version,request)
+
+def get_lineage_body(version, _data, concept, key):
+    """
+    gets the encoded ancestors, descendants or lineage of a concept in a resident version
+    """
+    concept_key = get_concept_key(concept,_data)
+    return VERSIONS.get_body(version, ('geneology', concept_key, key),
+                             lambda: encode_json(get_property(key, get_concept(concept_key,_data,datatype='geneology'), concept)))
+
+def get_properties_body(version, _data, concept):
+    """
+    gets the encoded raw properties of a concept in a resident version
+    """
+    key = get_concept_key(concept,_data)
+    get_concept(key,_data)
+    # the records are encoded once and shared by every version holding them
+    return VERSIONS.elements.get_serialized(version, key)
+
+def get_uri_body(version, uri_map, uri):
+    """
+    gets the encoded mappings of a uri in a resident version
+    """
+    # unknown uris get an empty list without being added to the map or the cache,
+    # so junk requests can't grow either of them
+    if unquote(uri) not in uri_map:
+        return {'identity': encode_json([])}
 
-async def lookup(concept, key, version = default_version):
+    return VERSIONS.get_body(version, ('uri', unquote(uri)), lambda: encode_json(get_keys_for_uri(uri_map,uri)))
+
+async def lookup(concept, key, version = default_version, request: Request = None):
     """
     This is used to implement /ancestors etc
     """
     try:
-        _data = get_data(version)
-        props = get_concept(concept,_data,datatype='geneology')
-        value=get_property(key,props,concept)
+        _data = await get_data(version)
+        version = VERSIONS.resolve(version)
+        variants = get_lineage_body(version, _data, concept, key)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=404)
 
-    return JSONResponse(content=value, status_code = 200)
+    return cached_response(version, variants, request)
+
+# registered before /bl/{concept}, which would take 'lca' for a concept
+@APP.get('/bl/lca',tags=["lookup"])
+async def lca(concepts: Union[List[str], None] = Query(default=None), mixins: bool = True, version = default_version):
+    """
+    Get the most specific concepts that all of the given concepts are, deepest first. There is more than one
+    when the concepts share branches that don't meet. With mixins=false, only is_a links count.
+    """
+    if not concepts:
+        return JSONResponse(content={"error": "No concepts given\n"}, status_code=400)
+
+    try:
+        _data = await get_data(version)
+        version = VERSIONS.resolve(version)
+        reachability = get_reachability(version, mixins)
+        rows = [get_row(reachability, concept, _data) for concept in dict.fromkeys(concepts)]
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+
+    raw = _data['raw']
+    result = [get_uri(raw[reachability.keys[row]]) for row in reachability.lowest_common_ancestors(rows)]
+
+    return JSONResponse(content=result, status_code=200)
 
 @APP.get('/bl/{concept}',tags=["lookup"])
-async def properties(concept, version = default_version):
+async def properties(concept, request: Request, version = default_version):
     """Get raw properties for concept."""
     try:
-        _data = get_data(version)
-        props = get_concept(concept,_data)
+        _data = await get_data(version)
+        version = VERSIONS.resolve(version)
+        variants = get_properties_body(version, _data, concept)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=404)
 
-    return JSONResponse(content=props, status_code=200)
+    return cached_response(version, variants, request)
 
 
 @APP.get('/uri_lookup/{uri}',tags=["lookup"])
-async def uri_lookup(uri, version = default_version):
+async def uri_lookup(uri, request: Request, version = default_version):
     """Look up slot by uri."""
 
     try:
-        uri_map = get_uri_map(version)
-        keys = get_keys_for_uri(uri_map,uri)
+        uri_map = await get_uri_map(version)
+        # the other lookups are counted by get_data
+        VERSION_REQUESTS.inc(version)
+        version = VERSIONS.resolve(version)
+        variants = get_uri_body(version, uri_map, uri)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=404)
 
-    return JSONResponse(content=keys, status_code=200)
+    return cached_response(version, variants, request)
+
+
+class BatchItem(BaseModel):
+    op: str
+    concept: Optional[str] = None
+    uri: Optional[str] = None
+    version: str = default_version
+
+BATCH_OPS = ('ancestors', 'descendants', 'lineage', 'properties', 'uri_lookup')
+
+@APP.post('/bl/batch',tags=["lookup"])
+async def batch(items: List[BatchItem]):
+    """
+    Run many lookups in one request. Each item has an op (ancestors, descendants, lineage, properties or uri_lookup),
+    the concept or uri to look up, and optionally a version. The response is a list in the same order, with either
+    a "result" or an "error" for each item.
+    """
+    results = [None] * len(items)
+
+    # group the items by version so each version is acquired once, and nothing can
+    # evict it while its items are looked up
+    by_version = {}
+
+    for index, item in enumerate(items):
+        by_version.setdefault(item.version, []).append(index)
+
+    for requested, indexes in by_version.items():
+        try:
+            _data = await get_data(requested)
+            version = VERSIONS.resolve(requested)
+            uri_map = biolink_uri_maps[version]
+        except Exception as e:
+            error = encode_json({"error": str(e)})
+            for index in indexes:
+                results[index] = error
+            continue
+
+        for index in indexes:
+            item = items[index]
 
+            try:
+                if item.op not in BATCH_OPS:
+                    raise Exception(f"Unknown op '{item.op}'\n")
+
+                if item.op == 'uri_lookup':
+                    if item.uri is None:
+                        raise Exception("No uri given\n")
+                    body = get_uri_body(version, uri_map, item.uri)['identity']
+                elif item.concept is None:
+                    raise Exception("No concept given\n")
+                elif item.op == 'properties':
+                    body = get_properties_body(version, _data, item.concept)['identity']
+                else:
+                    body = get_lineage_body(version, _data, item.concept, item.op)['identity']
+
+                results[index] = b'{"result":' + body + b'}'
+            except Exception as e:
+                results[index] = encode_json({"error": str(e)})
+
+    # the bodies are already encoded, so just stitch them together
+    return Response(content=b'[' + b','.join(results) + b']', status_code=200, media_type='application/json')
+
+
+def get_reachability(version, mixins=True):
+    """
+    gets the is_a checks of a resident version, counting the mixins as parents or not
+    """
+    if mixins:
+        return VERSIONS.get_index(version, 'reachability', lambda data: Reachability.from_geneology(data['raw'], data['geneology']))
+
+    return VERSIONS.get_index(version, 'is_a_reachability', lambda data: Reachability.from_is_a(data['raw']))
+
+def get_row(reachability, concept, _data):
+    row = reachability.row(get_concept_key(concept, _data))
+    if row is None:
+        raise Exception(f"No '{concept}'\n")
+    return row
+
+@APP.get('/bl/{child}/is_a/{parent}',tags=["lookup"])
+async def is_a(child, parent, mixins: bool = True, version = default_version):
+    """Check whether child is parent or one of its descendants. With mixins=false, only is_a links count."""
+    try:
+        _data = await get_data(version)
+        version = VERSIONS.resolve(version)
+        reachability = get_reachability(version, mixins)
+        result = reachability.is_a(get_row(reachability, child, _data), get_row(reachability, parent, _data))
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+
+    return JSONResponse(content=result, status_code=200)
+
+# the pairs are read without pydantic, which would take most of the time of a big batch
+IS_A_BATCH_BODY = {
+    'requestBody': {
+        'required': True,
+        'content': {'application/json': {'schema': {
+            'type': 'array',
+            'items': {'type': 'array', 'items': {'type': 'string'}, 'minItems': 2, 'maxItems': 2},
+        }}},
+    },
+}
+
+@APP.post('/bl/is_a',tags=["lookup"],openapi_extra=IS_A_BATCH_BODY)
+async def batch_is_a(request: Request, mixins: bool = True, version = default_version):
+    """
+    Check many [child, parent] pairs at once. The response is a list in the same order, with true or false
+    for each pair, or null if either concept is unknown.
+    """
+    try:
+        pairs = json.loads(await request.body())
+    except ValueError:
+        pairs = None
+
+    if not isinstance(pairs, list):
+        return JSONResponse(content={"error": "The body must be a list of [child, parent] pairs\n"}, status_code=400)
+
+    try:
+        _data = await get_data(version)
+        version = VERSIONS.resolve(version)
+        reachability = get_reachability(version, mixins)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+
+    # a batch names the same few concepts over and over, so find each one once
+    rows = {}
+
+    def find(concept):
+        if concept not in rows:
+            try:
+                rows[concept] = get_row(reachability, concept, _data)
+            except Exception:
+                rows[concept] = None
+        return rows[concept]
+
+    results = []
+
+    for index, pair in enumerate(pairs):
+        if not isinstance(pair, list) or len(pair) != 2 or not isinstance(pair[0], str) or not isinstance(pair[1], str):
+            return JSONResponse(content={"error": f"Item {index} is not a [child, parent] pair\n"}, status_code=400)
+
+        child_row, parent_row = find(pair[0]), find(pair[1])
+        results.append(None if child_row is None or parent_row is None else reachability.is_a(child_row, parent_row))
+
+    return JSONResponse(content=results, status_code=200)
+
+
+async def find_mapped_ro(predicate, uri_map):
+    """
+    walks up the RO property hierarchy from a predicate to the nearest ancestor that has a mapping
+
+    :param predicate: the RO curie
+    :param uri_map: the uri map of the version
+    :return: the ancestor, or None if no ancestor has one
+    """
+    def is_mapped(ro):
+        return ro in uri_map and len(uri_map[ro]) > 0
+
+    # the local copy answers without going to the network
+    if ro_hierarchy is not None and predicate in ro_hierarchy:
+        return ro_hierarchy.find_nearest(predicate, is_mapped)
+
+    if getattr(args, 'offline', False):
+        return None
+
+    # get the shared client that does ubergraph operations
+    ug = get_ubergraph()
+
+    seen = {predicate}
+    ro_idents = [predicate]
+
+    # go up one level at a time until there are no options left, with one query per level
+    while ro_idents:
+        try:
+            parents = await ug.get_property_parents(ro_idents)
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            # treat it like a predicate with no mapped ancestor, rather than failing the whole request
+            logger.warning(f"Could not get the parents of {', '.join(ro_idents)} from UberGraph: {e!r}")
+            return None
+
+        new_ros = []
+
+        for child in ro_idents:
+            for ro in parents[child]:
+                if ro in seen:
+                    continue
+
+                # was it found
+                if is_mapped(ro):
+                    return ro
+
+                seen.add(ro)
+                new_ros.append(ro)
+
+        # start the loop over with the new values
+        ro_idents = new_ros
+
+    return None
 
 @APP.get('/resolve_predicate',tags=["lookup"])
 async def resolve(predicate: Union[List[str], None] = Query(default=None), version = default_version):
@@ -206,167 +785,68 @@ async def resolve(predicate: Union[List[str], None] = Query(default=None), versi
     result = {}
 
     try:
-        uri_map = get_uri_map(version)
-        concepts = get_data(version)
+        uri_map = await get_uri_map(version)
+        concepts = await get_data(version)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=404)
 
-    # get the class that does ubergraph operations
-    ug = UberGraph()
+    # the predicates resolved when the version was built
+    table = concepts.get('resolution', {'uris': {}, 'concepts': {}})
 
     # for each value received
     for predicate in predicates:
         # prep and decode the uri
         predicate = unquote(predicate)
 
-        # init the predicate mapping
-        pred_mapping = None
+        # the uri the predicate is mapped through, if any
+        uri = None
 
-        try:
-            # is we find a value use it
-            if predicate in uri_map:
-                # get the mapped result for the predicate
-                pred_mapping = uri_map[predicate]
-            # otherwise look into ubergraph for it
-            else:
-                # if this is an RO query
-                if predicate.startswith('RO'):
-                    ro_idents = [predicate]
-
-                    # flag to indicate the value was found
-                    found = False
-
-                    # continue until there are no options left
-                    while True:
-                        new_ros = []
-
-                        # get the RO parents from ubergraph
-                        for ro in ro_idents:
-                            new_ros += ug.get_property_parent(ro)
-
-                        # none found, go with the default
-                        if len(new_ros) == 0:
-                            break
-
-                        # for the ones returned from ubergraph
-                        for ro in new_ros:
-                            # is it in the uri map
-                            if ro in uri_map:
-                                keys = uri_map[ro]
-                            else:
-                                keys = []
-
-                            # was it found
-                            if len(keys) > 0:
-                                found = True
-                                break
-
-                        # was it found
-                        if found:
-                            pred_mapping = uri_map[ro]
-                            break
-
-                        # start the loop over with a new value
-                        ro_idents = new_ros
-
-                    if pred_mapping is None or len(pred_mapping) == 0:
-                        # use the default (related to)
-                        pred_mapping = uri_map['RO:0002093']
-        except KeyError:
-            continue
-            # return response.text(f"No uri mapping for '{predicate}'\n", status=404)
+        # how it was resolved, for the metrics
+        outcome = 'concept'
+
+        # is we find a value use it
+        if predicate in uri_map:
+            uri = predicate
+            outcome = 'uri_map'
+        # otherwise look up the RO hierarchy for it
+        elif predicate.startswith('RO'):
+            uri = await find_mapped_ro(predicate, uri_map)
+            outcome = 'ro_fallback'
 
-        # if we dont have a predicate mapping yet
-        if pred_mapping is None or len(pred_mapping) == 0:
-            # sometimes a concept comes in as a result of a previous predicate resolution
-            concept = key_case(unquote(predicate))
+            if uri is None:
+                # use the default (related to)
+                uri = 'RO:0002093'
+                outcome = 'related_to'
+
+        pred_mapping = uri_map.get(uri, []) if uri is not None else []
+
+        if len(pred_mapping) > 0:
+            mapping = pred_mapping[0]['mapping']
+            entry = table['uris'].get(uri)
         else:
-            # use what we got
-            concept = key_case(pred_mapping[0]['mapping']['predicate'])
+            mapping = {}
+            entry = table['concepts'].get(key_case(predicate))
 
-        try:
-            # get the concept properties
-            props = concepts['raw'][concept]
-
-            # was there a result
-            if len(props) == 0:
-                raise KeyError
-
-            #We might need to invert the predicate though
-            # There are no canonical directions in biolink before 2.0
-            major_version = version.split('.')[0]
-            if major_version == '1':
-                inverted = False
+        # anything not in the table is worked out here, the same way the table was built
+        if entry is None:
+            if len(pred_mapping) > 0:
+                concept = key_case(mapping['predicate'])
             else:
-                #can't invert a symmetric property
-                sym = props['symmetric']
-                if (sym is not None) and sym:
-                    inverted = False
-                elif props['inverse'] is None:
-                    #Can't invert something with no inverse.
-                    inverted = False
-                else:
-                    #annots = props['annotations']
-                    if 'biolink:canonical_predicate' in props and props['biolink:canonical_predicate'].upper() == 'TRUE':
-                        #this is the canonical direction, all good
-                        inverted = False
-                    else:
-                        #this is not the canonical direction, and it's not symmetric, we need to flip it (flip it good).
-                        newconcept =  key_case(props['inverse'])
-                        iprops = concepts['raw'][newconcept]
-                        if 'biolink:canonical_predicate' in iprops and iprops['biolink:canonical_predicate'].upper() == 'TRUE':
-                            inverted = True
-                            props = iprops
-                        else:
-                            #neither is claimed as being canonical; just leave it alone
-                            inverted = False
-            label = props['name']
-            pred= props['slot_uri']
+                # sometimes a concept comes in as a result of a previous predicate resolution
+                concept = key_case(predicate)
+
             try:
-                q = pred_mapping[0]['mapping']
-            except:
-                q = {}
-            quals = {}
-            #this crummy processing should maybe go on read
-            for k,v in q.items():
-                if k == 'predicate':
-                    continue
-                sc = '_'.join(v.split())
-                if k in ['predicate','qualified predicate']:
-                    if not sc.startswith('biolink'):
-                        sc = f"biolink:{sc}"
-                sk = '_'.join(k.split())
-                quals[sk] = sc
-        except KeyError:
-            result[predicate] = {
-                'predicate': 'biolink:related_to',
-                'label': 'related to',
-                'inverted': False
-            }
-            continue
+                entry = resolve_predicate_entry(concepts['raw'], concept, mapping, version)
+            except KeyError:
+                entry = RELATED_TO
+
+        # whichever way it got there, ending up at related to is counted as such
+        if entry == RELATED_TO:
+            outcome = 'related_to'
+
+        RESOLUTIONS.inc(outcome)
+        result[predicate] = entry
 
-        # did we get everything
-        if props:
-            # add the dat to the result
-            result[predicate] = {
-                'predicate': pred,
-                'label': label,
-                'inverted': inverted
-            }
-            result[predicate].update(quals)
-
-        # We might need to transform these into qualified predicates
-#        if major_version == 'v3':
-#            pmap = biolink_qualifier_map
-#            if pred in pmap:
-#                result[predicate].update(pmap[pred])
-#                if inverted:
-#                    rpred = result[predicate]
-#                    toreplace = [x for x in rpred.keys() if x.startswith('object')]
-#                    for k in toreplace:
-#                        newk = k.replace('object','subject')
-#                        rpred[newk] = rpred[k]
-#                        del rpred[k]
     # if nothing was found
     if len(result) == 0:
         ret_status = 404
@@ -376,10 +856,108 @@ async def resolve(predicate: Union[List[str], None] = Query(default=None), versi
     return JSONResponse(content=result, status_code=ret_status)
 
 
+# the most results a search returns
+MAX_SEARCH_LIMIT = 1000
+
+@APP.get('/search',tags=["lookup"])
+async def search(q: str, kind: Optional[str] = None, limit: int = 20, infix: bool = True, version = default_version):
+    """
+    Find the elements with a name, alias or uri starting with q, then, unless infix is false, those containing it.
+    kind is one of class, predicate, mixin or association.
+    """
+    if kind is not None and kind not in KINDS:
+        return JSONResponse(content={"error": f"Unknown kind '{kind}', expected one of {', '.join(KINDS)}\n"}, status_code=400)
+
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        return JSONResponse(content={"error": f"The limit must be from 1 to {MAX_SEARCH_LIMIT}\n"}, status_code=400)
+
+    try:
+        await get_data(version)
+        version = VERSIONS.resolve(version)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+
+    # the index is built the first time a version is searched
+    index = VERSIONS.get_index(version, 'search', lambda data: SearchIndex(data['raw'], data['geneology']))
+
+    return JSONResponse(content=index.search(q, kind, limit, infix), status_code=200)
+
+
+@APP.get('/diff',tags=["meta"])
+async def diff(request: Request, from_version: str = Query(alias='from'), to_version: str = Query(alias='to'), kind: Optional[str] = None):
+    """
+    Get what changed from one version to another: the elements added and removed, the changes to the is_a, mixins,
+    inverse, symmetric, canonical and deprecated properties of the others, and the changes to the uri mappings.
+    kind is one of class, predicate, mixin or association.
+    """
+    if kind is not None and kind not in KINDS:
+        return JSONResponse(content={"error": f"Unknown kind '{kind}', expected one of {', '.join(KINDS)}\n"}, status_code=400)
+
+    try:
+        # keep hold of the maps, loading the second version could evict the first
+        from_data = await get_data(from_version)
+        from_version = VERSIONS.resolve(from_version)
+        from_uri_map = biolink_uri_maps[from_version]
+
+        to_data = await get_data(to_version)
+        to_version = VERSIONS.resolve(to_version)
+        to_uri_map = biolink_uri_maps[to_version]
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=404)
+
+    # the first version was reloaded or evicted while the second one loaded, so don't keep this comparison
+    if biolink_data.get(from_version) is not from_data:
+        variants = make_variants(encode_json(filter_diff(diff_versions(from_version, from_data, from_uri_map, to_version, to_data, to_uri_map), kind)))
+        return json_bytes_response(variants, None, None, request.headers.get('accept-encoding'))
+
+    # the comparison is worked out once per pair, and each filtered form of it encoded once
+    def compare():
+        return VERSIONS.get_pair_index(from_version, to_version, 'diff',
+                                       lambda: diff_versions(from_version, from_data, from_uri_map, to_version, to_data, to_uri_map))
+
+    variants = VERSIONS.get_pair_index(from_version, to_version, ('body', kind),
+                                       lambda: make_variants(encode_json(filter_diff(compare(), kind))))
+
+    digests = from_data.get('digest'), to_data.get('digest')
+    etag = make_etag(digests[0][:16] + digests[1][:16]) if all(digests) else None
+
+    return json_bytes_response(variants, etag, request.headers.get('if-none-match'), request.headers.get('accept-encoding'))
+
+@APP.post('/admin/reload',tags=["meta"])
+async def admin_reload(request: Request):
+    """
+    Check for new releases and changed versions now, instead of waiting for the next scheduled check.
+    Needs the admin token the server was started with, as a bearer token.
+    """
+    token = getattr(args, 'admin_token', None)
+
+    if not token:
+        return JSONResponse(content={"error": "Reloading is not enabled\n"}, status_code=403)
+
+    if not secrets.compare_digest(request.headers.get('authorization', ''), f'Bearer {token}'):
+        return JSONResponse(content={"error": "Not authorized\n"}, status_code=401)
+
+    try:
+        result = await reload_versions()
+    except Exception as e:
+        return JSONResponse(content={"error": f"Could not reload: {e}\n"}, status_code=502)
+
+    return JSONResponse(content=result, status_code=200)
+
 @APP.get('/versions',tags=["meta"])
-async def versions():
-    """Get available BL versions."""
-    return JSONResponse(content = list(biolink_data.keys()), status_code = 200)
+async def versions(aliases: bool = False):
+    """Get available BL versions. With aliases=true, also get which versions are the same as another one."""
+    available = list(VERSIONS.available or biolink_data.keys())
+
+    if aliases:
+        return JSONResponse(content = {'versions': available, 'aliases': VERSIONS.aliases}, status_code = 200)
+
+    return JSONResponse(content = available, status_code = 200)
+
+@APP.get('/metrics',tags=["meta"])
+async def metrics():
+    """Get request latencies, requests per version, UberGraph queries, predicate resolutions and version loads, in the Prometheus text format."""
+    return Response(content=render(), media_type=CONTENT_TYPE)
 
-# note: this must be commented out for local debugging
-APP.openapi_schema = construct_open_api_schema()
+# the schema is built the first time it is asked for
+APP.openapi = construct_open_api_schema
@@ -0,0 +1,276 @@
+"""Precompiled per-version snapshots of the biolink maps.
+
+A snapshot holds the ``geneology``, ``raw``, ``resolution``, ``aliases`` and ``uri_map`` structures that
+``generate_bl_map`` builds for one model version, so the server can load them
+from disk instead of rebuilding them with BMT on every start.
+
+The file is a single JSON header line followed by the JSON payload. The header
+records the snapshot format, the model version, the urls the maps were built
+from and a sha256 checksum of the payload.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import pathlib
+from collections import defaultdict
+
+from bl_lookup.bl import build_alias_index, generate_bl_map, get_models
+from bl_lookup.geneology import Geneology
+from bl_lookup.http_cache import fetch
+from bl_lookup.util import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# bump this whenever the layout of the maps produced by generate_bl_map changes
+SNAPSHOT_FORMAT = 4
+
+
+def snapshot_path(snapshot_dir, version) -> pathlib.Path:
+    """
+    gets the path of the snapshot file for a version
+
+    :param snapshot_dir: the directory holding the snapshots
+    :param version: the biolink model version
+    :return: the path of the snapshot file
+    """
+    return pathlib.Path(snapshot_dir).joinpath(f'{version}.snapshot')
+
+
+def get_sources(version) -> dict:
+    """
+    gets the urls a version is built from
+
+    :param version: the biolink model version
+    :return: a dict with the model and predicate mapping urls
+    """
+    models, mappings = get_models()
+
+    return {'model': models.get(version), 'mapping': mappings.get(version)}
+
+
+def get_source_digest(version, sources=None) -> str:
+    """
+    hashes the contents of the files a version is built from. versions with the same digest build the same maps
+
+    :param version: the biolink model version
+    :param sources: the urls the version is built from, looked up if not given
+    :return: the hex digest
+    """
+    if sources is None:
+        sources = get_sources(version)
+
+    digest = hashlib.sha256()
+
+    for key in ('model', 'mapping'):
+        url = sources.get(key)
+        digest.update(fetch(url) if url else b'')
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+def dumps(version, sources, data, uri_map) -> bytes:
+    """
+    serializes the maps for a version into snapshot bytes
+
+    :param version: the biolink model version
+    :param sources: the urls the maps were built from
+    :param data: the geneology and raw data
+    :param uri_map: the uri map
+    :return: the snapshot contents
+    """
+    geneology = data['geneology']
+
+    if not isinstance(geneology, Geneology):
+        geneology = Geneology.from_lists(geneology)
+
+    if 'aliases' in data:
+        aliases, collisions = data['aliases'], data.get('alias_collisions', {})
+    else:
+        aliases, collisions = build_alias_index(data['raw'])
+
+    source_digest = data.get('source_digest')
+
+    data = {'geneology': geneology.to_dict(), 'raw': data['raw'], 'resolution': data.get('resolution', {'uris': {}, 'concepts': {}}),
+            'aliases': aliases, 'alias_collisions': collisions}
+
+    payload = json.dumps({'data': data, 'uri_map': uri_map}, separators=(',', ':')).encode('utf-8')
+
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'sources': sources,
+        'sha256': hashlib.sha256(payload).hexdigest(),
+    }
+
+    if source_digest is not None:
+        header['source_digest'] = source_digest
+
+    return json.dumps(header).encode('utf-8') + b'\n' + payload
+
+
+def loads(blob, version=None, sources=None) -> (dict, dict):
+    """
+    deserializes snapshot bytes. raises a ValueError if the snapshot is corrupt or stale
+
+    :param blob: the snapshot contents
+    :param version: the expected biolink model version, or None to skip the check
+    :param sources: the expected source urls, or None to skip the check
+    :return: the geneology and raw data, and the uri map
+    """
+    header_line, _, payload = blob.partition(b'\n')
+
+    try:
+        header = json.loads(header_line)
+    except ValueError:
+        raise ValueError('Snapshot header is not readable.')
+
+    if header.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Snapshot format {header.get('format')} is not {SNAPSHOT_FORMAT}.")
+
+    if version is not None and header.get('version') != version:
+        raise ValueError(f"Snapshot is for version '{header.get('version')}', not '{version}'.")
+
+    if sources is not None and header.get('sources') != sources:
+        raise ValueError(f"Snapshot was built from {header.get('sources')}, not {sources}.")
+
+    if hashlib.sha256(payload).hexdigest() != header.get('sha256'):
+        raise ValueError('Snapshot checksum does not match.')
+
+    contents = json.loads(payload)
+    contents['data']['geneology'] = Geneology.from_dict(contents['data']['geneology'])
+
+    # the checksum doubles as the content hash of the version
+    contents['data']['digest'] = header['sha256']
+
+    # the urls it was built from, and the hash of those files, to tell when they change
+    contents['data']['sources'] = header.get('sources')
+
+    if header.get('source_digest'):
+        contents['data']['source_digest'] = header['source_digest']
+
+    # the server relies on missing uris coming back as an empty list
+    return contents['data'], defaultdict(list, contents['uri_map'])
+
+
+def write_snapshot(snapshot_dir, version, data, uri_map, sources=None) -> pathlib.Path:
+    """
+    writes the snapshot for a version
+
+    :param snapshot_dir: the directory holding the snapshots
+    :param version: the biolink model version
+    :param data: the geneology and raw data
+    :param uri_map: the uri map
+    :param sources: the urls the maps were built from, looked up if not given
+    :return: the path of the snapshot file
+    """
+    if sources is None:
+        sources = get_sources(version)
+
+    path = snapshot_path(snapshot_dir, version)
+    atomic_write(path, dumps(version, sources, data, uri_map))
+
+    return path
+
+
+def read_snapshot(snapshot_dir, version, sources=None):
+    """
+    reads the snapshot for a version
+
+    :param snapshot_dir: the directory holding the snapshots
+    :param version: the biolink model version
+    :param sources: the urls the version should have been built from, looked up if not given
+    :return: the geneology and raw data and the uri map, or None if the snapshot is missing or stale
+    """
+    path = snapshot_path(snapshot_dir, version)
+
+    if not path.exists():
+        return None
+
+    if sources is None:
+        sources = get_sources(version)
+
+    try:
+        return loads(path.read_bytes(), version, sources)
+    except ValueError as e:
+        logger.warning(f"Ignoring snapshot {path}: {e}")
+        return None
+
+
+def read_source_digest(snapshot_dir, version, sources):
+    """
+    gets the source digest kept in the header of a version's snapshot, without reading the rest of it
+
+    :param snapshot_dir: the directory holding the snapshots
+    :param version: the biolink model version
+    :param sources: the urls the version is built from now
+    :return: the hex digest, or None if there is no snapshot or it was built from other urls
+    """
+    path = snapshot_path(snapshot_dir, version)
+
+    if not path.exists():
+        return None
+
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+
+    try:
+        header = json.loads(header_line)
+    except ValueError:
+        return None
+
+    # the digest only says something about the current files if they are the ones it was taken from
+    if header.get('format') != SNAPSHOT_FORMAT or header.get('version') != version or header.get('sources') != sources:
+        return None
+
+    return header.get('source_digest')
+
+
+def add_source_digest(version, data, sources=None):
+    """
+    records the hash of the files a version was just built from, so a reload can tell when they change
+
+    :param version: the biolink model version
+    :param data: the maps built for the version
+    :param sources: the urls the version was built from, looked up if not given
+    """
+    try:
+        data['source_digest'] = get_source_digest(version, sources)
+    except Exception as e:
+        logger.warning(f"Could not hash the sources of version '{version}': {e}")
+
+
+def compile_snapshot(version, snapshot_dir) -> pathlib.Path:
+    """
+    builds the maps for a version with BMT and writes them to a snapshot
+
+    :param version: the biolink model version
+    :param snapshot_dir: the directory holding the snapshots
+    :return: the path of the snapshot file
+    """
+    data, uri_map = generate_bl_map(version=version)
+    add_source_digest(version, data)
+
+    return write_snapshot(snapshot_dir, version, data, uri_map)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile biolink model snapshots.')
+    parser.add_argument('--snapshot-dir', required=True, type=str)
+    parser.add_argument('versions', nargs='*', help='versions to compile, all available versions if none are given')
+    args = parser.parse_args(argv)
+
+    versions = args.versions
+
+    if not versions:
+        models, mappings = get_models()
+        versions = list(models.keys())
+
+    for version in versions:
+        path = compile_snapshot(version, args.snapshot_dir)
+        print(f'{version}: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,71 @@
+import asyncio
+import logging
 import os
-import traceback
-from pprint import pprint
-from SPARQLWrapper import SPARQLWrapper2, JSON, POSTDIRECTLY, POST
 from string import Template
 
+import httpx
+
+logger = logging.getLogger(__name__)
 
 class TripleStore(object):
-    """ Connect to a SPARQL endpoint and provide services for loading and executing queries."""
+    """ Connect to a SPARQL endpoint and provide services for loading and executing queries.
+
+    Queries go through one keep-alive connection pool, and at most max_concurrency of them
+    are in flight at once, so a slow endpoint can't tie up every connection or the event loop.
+    """
+
+    def __init__(self, hostname, timeout=10.0, max_concurrency=8, transport=None):
+        """
+        :param hostname: the url of the SPARQL endpoint
+        :param timeout: seconds to wait for the endpoint
+        :param max_concurrency: the most queries in flight at once
+        :param transport: an httpx transport to use instead of the network, for testing
+        """
+        self.hostname = hostname
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+
+        # the pool and the limit belong to the event loop they were made on
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+
+        # the closing of pools left behind on an old event loop
+        self._closing = set()
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                # the old pool can't be used from this loop, so close it rather than leave its connections open
+                task = loop.create_task(self._discard(self._client))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
 
-    def __init__(self, hostname):
-        self.service =  SPARQLWrapper2 (hostname)
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self._client, self._semaphore
+
+    @staticmethod
+    async def _discard(client):
+        try:
+            await client.aclose()
+        except Exception as e:
+            # its connections may belong to a loop that is already closed
+            logger.debug(f"Could not close the connection pool of an old event loop: {e!r}")
+
+    async def close(self):
+        if self._client is not None:
+            client, self._client, self._loop = self._client, None, None
+            await client.aclose()
 
     def get_template (self, query_name):
         """ Load a template given a template name """
@@ -23,36 +79,44 @@ class TripleStore(object):
         with open (fn, 'r') as stream:
             query = stream.read ()
         return query
-    
-    def execute_query (self, query, post=False):
+
+    async def execute_query (self, query, post=False, timeout=None):
         """ Execute a SPARQL query.
 
         :param query: A SPARQL query.
+        :param timeout: seconds to wait for this query, if not the usual timeout
         :return: Returns a JSON formatted object.
         """
-        if post:
-            self.service.setRequestMethod(POSTDIRECTLY)
-            self.service.setMethod(POST)
-        self.service.setQuery (query)
-        self.service.setReturnFormat (JSON)
-        return self.service.query().convert ()
-    
-    def query (self, query_text, outputs, flat=False, post = False):
+        client, semaphore = self._get_client()
+        headers = {'Accept': 'application/sparql-results+json'}
+        timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+
+        async with semaphore:
+            if post:
+                response = await client.post(self.hostname, content=query.encode('utf-8'),
+                                             headers={**headers, 'Content-Type': 'application/sparql-query'}, timeout=timeout)
+            else:
+                response = await client.get(self.hostname, params={'query': query}, headers=headers, timeout=timeout)
+
+        response.raise_for_status()
+        return response.json()
+
+    async def query (self, query_text, outputs, flat=False, post = False, timeout=None):
         """ Execute a fully formed query and return results. """
-        response = self.execute_query (query_text, post)
+        response = await self.execute_query (query_text, post, timeout)
+        bindings = response['results']['bindings']
         result = None
         if flat:
-            result = list(map(lambda b : [ b[val].value if val in b else None for val in outputs    ], response.bindings ))
+            result = list(map(lambda b : [ b[val]['value'] if val in b else None for val in outputs    ], bindings ))
         else:
-            result = list(map(lambda b : { val : b[val].value if val in b else None for val in outputs  }, response.bindings ))
+            result = list(map(lambda b : { val : b[val]['value'] if val in b else None for val in outputs  }, bindings ))
 
         return result
 
-    def query_template (self, template_text, outputs, inputs=[], post = False):
+    async def query_template (self, template_text, outputs, inputs=[], post = False):
         """ Given template text, inputs, and outputs, execute a query. """
-        return self.query (Template (template_text).safe_substitute (**inputs), outputs, post= post)
-    
-    def query_template_file (self, template_file, outputs, inputs=[]):
-        """ Given the name of a template file, inputs, and outputs, execute a query. """
-        return self.query (self.get_template_text (template_file), inputs, outputs)
+        return await self.query (Template (template_text).safe_substitute (**inputs), outputs, post= post)
 
+    async def query_template_file (self, template_file, outputs, inputs=[]):
+        """ Given the name of a template file, inputs, and outputs, execute a query. """
+        return await self.query (self.get_template_text (template_file), inputs, outputs)
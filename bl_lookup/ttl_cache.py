@@ -0,0 +1,124 @@
+"""A bounded in-memory cache for async lookups, with expiry and request coalescing."""
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Keeps the results of an async lookup for ttl seconds, and at most maxsize of them,
+    dropping the least recently used first. Concurrent misses for the same key share one
+    lookup. Failed lookups are not kept.
+    """
+
+    def __init__(self, maxsize=10000, ttl=86400):
+        """
+        :param maxsize: the most results to keep
+        :param ttl: seconds a result is kept, None for no expiry
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # key -> (expiry time, value), in least recently used order
+        self.entries = OrderedDict()
+
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, key, fetch):
+        """
+        gets the value for a key, looking it up on a miss
+
+        :param key: the key
+        :param fetch: called with no arguments on a miss, returns an awaitable of the value
+        :return: the value
+        """
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            if entry[0] is None or entry[0] > time.monotonic():
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+
+            del self.entries[key]
+
+        # somebody is already looking this one up, wait for them
+        task = self._pending.get(key)
+
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._pending[key] = task
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    async def get_many(self, keys, fetch_many) -> dict:
+        """
+        gets the values for many keys, looking up all the misses at once
+
+        :param keys: the keys
+        :param fetch_many: called with the list of missed keys, returns an awaitable of a dict of key to value
+        :return: a dict of key to value
+        """
+        values = {}
+        waits = {}
+        missing = []
+
+        for key in dict.fromkeys(keys):
+            entry = self.entries.get(key)
+
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self.hits += 1
+                self.entries.move_to_end(key)
+                values[key] = entry[1]
+            elif key in self._pending:
+                self.coalesced += 1
+                waits[key] = self._pending[key]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing:
+            batch = asyncio.ensure_future(fetch_many(missing))
+
+            # single lookups of these keys wait on the batch too
+            for key in missing:
+                self._pending[key] = waits[key] = asyncio.ensure_future(self._fetch(key, lambda key=key: self._from_batch(batch, key)))
+
+        # gather, so a failed batch is reported once rather than left in every task
+        values.update(zip(waits, await asyncio.gather(*[asyncio.shield(task) for task in waits.values()])))
+
+        return values
+
+    @staticmethod
+    async def _from_batch(batch, key):
+        return (await batch)[key]
+
+    async def _fetch(self, key, fetch):
+        try:
+            value = await fetch()
+
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic() + self.ttl if self.ttl is not None else None, value)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+            return value
+        finally:
+            del self._pending[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        :return: the hit, miss and coalesced counts and the number of entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'size': len(self.entries)}
@@ -1,17 +1,35 @@
+import os
 from bl_lookup.triplestore import TripleStore
+from bl_lookup.ttl_cache import TTLCache
+from bl_lookup.metrics import Timer, UBERGRAPH_SECONDS
 from bl_lookup.util import Text
 from collections import defaultdict
 
+UBERGRAPH_URL = os.environ.get('UBERGRAPH_URL', "https://ubergraph.apps.renci.org/sparql")
+
 class UberGraph:
 
-    def __init__(self):
-        self.triplestore = TripleStore("https://ubergraph.apps.renci.org/sparql")
+    def __init__(self, url=UBERGRAPH_URL, timeout=10.0, max_concurrency=8, transport=None, cache_size=10000, cache_ttl=86400):
+        self.triplestore = TripleStore(url, timeout=timeout, max_concurrency=max_concurrency, transport=transport)
+
+        # the ontologies change rarely, and the same terms are asked about over and over
+        self.entity_parents = TTLCache(cache_size, cache_ttl)
+        self.property_parents = TTLCache(cache_size, cache_ttl)
+
+    def cache_stats(self) -> dict:
+        return {'entity_parents': self.entity_parents.stats(), 'property_parents': self.property_parents.stats()}
+
+    async def close(self):
+        await self.triplestore.close()
 
     def is_subclass(self, parent, child):
         return False
 
-    def get_entity_parent(self,child):
+    async def get_entity_parent(self,child):
         """Given an ontology term, return its direct parent"""
+        return list(await self.entity_parents.get(child, lambda: self._query_entity_parent(child)))
+
+    async def _query_entity_parent(self,child):
         text="""
         prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
         SELECT DISTINCT ?parent
@@ -20,15 +38,19 @@ class UberGraph:
             $child rdfs:subClassOf ?parent .
             }
         """
-        results = self.triplestore.query_template(template_text=text,
-                                                  inputs = {'child':Text.curie_to_obo(child)},
-                                                  outputs = ['parent'])
+        with Timer(UBERGRAPH_SECONDS, 'entity_parent'):
+            results = await self.triplestore.query_template(template_text=text,
+                                                      inputs = {'child':Text.curie_to_obo(child)},
+                                                      outputs = ['parent'])
         #Convert obo uris to curies, and filter to remove things that aren't curies
         #because this also returns some blank node identifiers that look like 't1762439'
         return list(filter(lambda x: ':' in x,[Text.obo_to_curie(x['parent']) for x in results]))
 
-    def get_property_parent(self, child):
+    async def get_property_parent(self, child):
         """Given an ontology term, return its direct parent"""
+        return list(await self.property_parents.get(child, lambda: self._query_property_parent(child)))
+
+    async def _query_property_parent(self, child):
         text = """
         prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
         SELECT DISTINCT ?parent
@@ -37,10 +59,93 @@ class UberGraph:
             $child rdfs:subPropertyOf ?parent .
             }
         """
-        results = self.triplestore.query_template(template_text=text,
-                                                  inputs={'child': Text.curie_to_obo(child)},
-                                                  outputs=['parent'])
+        with Timer(UBERGRAPH_SECONDS, 'property_parent'):
+            results = await self.triplestore.query_template(template_text=text,
+                                                      inputs={'child': Text.curie_to_obo(child)},
+                                                      outputs=['parent'])
         # Convert obo uris to curies, and filter to remove things that aren't curies
         # because this also returns some blank node identifiers that look like 't1762439'
         return list(filter(lambda x: ':' in x, [Text.obo_to_curie(x['parent']) for x in results]))
 
+
+    async def get_property_parents(self, children):
+        """Given ontology terms, return a dict of each one to its direct parents, with one query for all of them"""
+        parents = await self.property_parents.get_many(children, self._query_property_parents)
+        return {child: list(child_parents) for child, child_parents in parents.items()}
+
+    async def _query_property_parents(self, children):
+        text = """
+        prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        SELECT DISTINCT ?child ?parent
+        FROM <http://reasoner.renci.org/ontology>
+        WHERE {
+            VALUES ?child { $children }
+            ?child rdfs:subPropertyOf ?parent .
+            }
+        """
+        # map the returned iris back to the curies that were asked for
+        by_iri = {Text.curie_to_obo(child)[1:-1]: child for child in children}
+        with Timer(UBERGRAPH_SECONDS, 'property_parents'):
+            results = await self.triplestore.query_template(template_text=text,
+                                                      inputs={'children': ' '.join(f'<{iri}>' for iri in by_iri)},
+                                                      outputs=['child', 'parent'])
+        parents = {child: [] for child in children}
+        for result in results:
+            parent = Text.obo_to_curie(result['parent'])
+            # skip the blank nodes, like the single term lookups do
+            if result['child'] in by_iri and ':' in parent:
+                parents[by_iri[result['child']]].append(parent)
+        return parents
+
+    async def get_all_property_parents(self, timeout=300.0):
+        """Get every obo property and its direct parents with one bulk query"""
+        text = """
+        prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        SELECT DISTINCT ?child ?parent
+        FROM <http://reasoner.renci.org/ontology>
+        WHERE {
+            ?child rdfs:subPropertyOf ?parent .
+            FILTER(STRSTARTS(STR(?child), "http://purl.obolibrary.org/obo/"))
+            }
+        """
+        with Timer(UBERGRAPH_SECONDS, 'all_property_parents'):
+            results = await self.triplestore.query(text, outputs=['child', 'parent'], timeout=timeout)
+        parents = defaultdict(list)
+        for result in results:
+            child, parent = Text.obo_to_curie(result['child']), Text.obo_to_curie(result['parent'])
+            # skip the blank nodes, like the single term lookups do
+            if ':' in child and ':' in parent:
+                parents[child].append(parent)
+        return dict(parents)
+
+# the one UberGraph client of the process, so every request shares its connection pool
+_ubergraph = None
+
+def get_ubergraph() -> UberGraph:
+    global _ubergraph
+    if _ubergraph is None:
+        _ubergraph = UberGraph()
+    return _ubergraph
+
+def configure(url=UBERGRAPH_URL, timeout=10.0, max_concurrency=8, cache_size=10000, cache_ttl=86400):
+    """
+    sets up the shared UberGraph client
+
+    :param url: the url of the SPARQL endpoint
+    :param timeout: seconds to wait for the endpoint
+    :param max_concurrency: the most queries in flight at once
+    :param cache_size: the most parent lookups to keep of each kind
+    :param cache_ttl: seconds a parent lookup is kept
+    """
+    global _ubergraph
+    _ubergraph = UberGraph(url, timeout=timeout, max_concurrency=max_concurrency, cache_size=cache_size, cache_ttl=cache_ttl)
+
+def cache_stats() -> dict:
+    """
+    :return: the stats of each parent cache of the shared client, or nothing if it was never used
+    """
+    return _ubergraph.cache_stats() if _ubergraph is not None else {}
+
+async def close():
+    if _ubergraph is not None:
+        await _ubergraph.close()
@@ -1,3 +1,35 @@
+import os
+import pathlib
+import tempfile
+
+
+def atomic_write(path, data):
+    """
+    writes a file to a temporary name next to it and renames it into place, so a reader never
+    sees a partial file. each writer gets its own temporary file, so two writing the same path
+    don't clobber each other and the last one to finish wins
+
+    :param path: the file
+    :param data: the contents, bytes or text
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    tmp = tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + '.', suffix='.tmp', delete=False)
+
+    try:
+        with tmp:
+            tmp.write(data)
+
+        # temporary files are only readable by their owner
+        os.chmod(tmp.name, 0o644)
+        os.replace(tmp.name, path)
+    except BaseException:
+        pathlib.Path(tmp.name).unlink(missing_ok=True)
+        raise
 
 
 class Text:
@@ -0,0 +1,478 @@
+"""Keep a bounded set of biolink model versions resident, loading them on demand."""
+import asyncio
+import fnmatch
+import logging
+import multiprocessing
+import re
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from bl_lookup.element_store import ElementStore
+from bl_lookup.loader import build_version
+from bl_lookup.metrics import VERSION_LOAD_SECONDS
+from bl_lookup.responses import make_etag, make_variants
+from bl_lookup.snapshot import get_source_digest, get_sources, loads, read_snapshot, read_source_digest, snapshot_path
+
+logger = logging.getLogger(__name__)
+
+
+def parse_version(version):
+    """
+    parses a version name like 'v3.1.2' or '2.2.3' into a tuple of ints
+
+    :param version: the version name
+    :return: a tuple of ints, or None for names like 'latest'
+    """
+    match = re.match(r'v?(\d+(?:\.\d+)*)', version)
+
+    if match is None:
+        return None
+
+    return tuple(int(part) for part in match.group(1).split('.'))
+
+
+class VersionPolicy:
+    """Decides which of the released versions may be served."""
+
+    def __init__(self, patterns=None, min_version=None):
+        """
+        :param patterns: version names or glob patterns, for example ['v3.*', 'latest']. all versions if empty
+        :param min_version: the oldest numbered version to serve. named versions like 'latest' are always allowed
+        """
+        self.patterns = list(patterns or [])
+        self.min_version = parse_version(min_version) if min_version else None
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        builds the policy from the --versions and --min-version command line options
+
+        :param args: the parsed command line arguments
+        :return: the policy
+        """
+        patterns = getattr(args, 'versions', None)
+
+        if isinstance(patterns, str):
+            patterns = [p.strip() for p in patterns.split(',') if p.strip()]
+
+        return cls(patterns, getattr(args, 'min_version', None))
+
+    def allows(self, version) -> bool:
+        if self.patterns and not any(fnmatch.fnmatchcase(version, p) for p in self.patterns):
+            return False
+
+        if self.min_version is not None:
+            parsed = parse_version(version)
+
+            if parsed is not None and parsed < self.min_version:
+                return False
+
+        return True
+
+    def select(self, versions) -> list:
+        return [version for version in versions if self.allows(version)]
+
+
+def find_aliases(versions, snapshot_dir=None) -> dict:
+    """
+    finds the versions that are built from the same files as another one, like 'latest'
+    and the release it points at. versions with the same urls are the same without looking
+    further. when only the model url is shared, the digests kept in the snapshots are compared,
+    and the files are only fetched and hashed for versions without a current snapshot
+
+    :param versions: the biolink model versions
+    :param snapshot_dir: the directory holding the snapshots, if any
+    :return: a dict of alias to the version it is the same as
+    """
+    by_url = {}
+
+    for version in versions:
+        sources = get_sources(version)
+        by_url.setdefault(sources['model'], {}).setdefault((sources['model'], sources['mapping']), []).append(version)
+
+    aliases = {}
+
+    for by_sources in by_url.values():
+        groups = list(by_sources.values())
+
+        # the mapping urls differ, so the files have to be compared
+        if len(groups) > 1:
+            by_digest = {}
+
+            for same in groups:
+                # the ones that couldn't be hashed still go together
+                by_digest.setdefault(_get_digest(same, snapshot_dir) or tuple(same), []).extend(same)
+
+            groups = list(by_digest.values())
+
+        for same in groups:
+            # numbered releases are the real names, the rest point at them
+            target = min(same, key=lambda version: parse_version(version) is None)
+
+            aliases.update({version: target for version in same if version != target})
+
+    return aliases
+
+
+def _get_digest(versions, snapshot_dir=None):
+    """
+    gets the digest of the files some versions with the same urls are built from, from one of
+    their snapshots if there is a current one, otherwise by fetching the files
+
+    :param versions: the versions, all with the same source urls
+    :param snapshot_dir: the directory holding the snapshots, if any
+    :return: the hex digest, or None if the files could not be fetched
+    """
+    sources = get_sources(versions[0])
+
+    if snapshot_dir is not None:
+        for version in versions:
+            digest = read_source_digest(snapshot_dir, version, sources)
+
+            if digest is not None:
+                return digest
+
+    try:
+        return get_source_digest(versions[0], sources)
+    except Exception as e:
+        logger.warning(f"Could not hash the sources of version '{versions[0]}': {e}")
+        return None
+
+
+class VersionManager:
+    """
+    Holds the data and uri maps of the resident versions.
+
+    A version is loaded the first time it is asked for, and concurrent first requests
+    share a single load. When more than max_versions are resident, or their size goes
+    over max_bytes, the least recently used versions are evicted. Pinned versions are
+    never evicted. Aliases share the data of the version they point at.
+    """
+
+    def __init__(self, max_versions=None, max_bytes=None, pinned=(), snapshot_dir=None, workers=None):
+        # these are the dicts the server reads from
+        self.data = dict()
+        self.uri_maps = dict()
+
+        # the versions that may be loaded, None for anything
+        self.available = None
+
+        # alias -> the version it is the same as
+        self.aliases = dict()
+
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self.snapshot_dir = snapshot_dir
+        self.workers = workers
+
+        # version -> approximate size in bytes, in least recently used order
+        self.sizes = OrderedDict()
+
+        # version -> seconds its last load or rebuild took
+        self.load_seconds = dict()
+
+        # the element records, shared between versions
+        self.elements = ElementStore()
+
+        # version -> key -> encoded response body, filled as they are asked for
+        self.bodies = dict()
+
+        # version -> name -> lookup structure derived from the maps, built as they are needed
+        self.indexes = dict()
+
+        # (version, version) -> name -> structure comparing the two, built as they are needed
+        self.pairs = dict()
+
+        self._loading = {}
+        self._pool = None
+
+    def is_available(self, version) -> bool:
+        return self.available is None or version in self.available
+
+    def resolve(self, version) -> str:
+        return self.aliases.get(version, version)
+
+    def is_pinned(self, version) -> bool:
+        return version in self.pinned or any(self.aliases.get(pinned) == version for pinned in self.pinned)
+
+    def set_aliases(self, aliases):
+        """
+        re-points the aliases all at once. a version that becomes an alias drops its own copy of the data
+
+        :param aliases: a dict of alias to the version it is the same as
+        """
+        self.aliases = dict(aliases)
+
+        for version in self.aliases:
+            if version in self.data:
+                self.drop(version)
+
+    def _get_pool(self):
+        if self._pool is None:
+            # the pool starts from an executor thread while the event loop runs, and a forked child could
+            # inherit a lock some other thread held at that moment. spawned ones start clean
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _load(self, version):
+        """
+        loads a version from its snapshot, or builds it in the process pool. this blocks
+
+        :param version: the biolink model version
+        :return: the data, the uri map and the approximate size of the version
+        """
+        if self.snapshot_dir is not None:
+            snapshot = read_snapshot(self.snapshot_dir, version)
+
+            if snapshot is not None:
+                return snapshot + (snapshot_path(self.snapshot_dir, version).stat().st_size,)
+
+        return self._build(version)
+
+    def _build(self, version):
+        """
+        builds a version from its sources in the process pool. this blocks
+
+        :param version: the biolink model version
+        :return: the data, the uri map and the approximate size of the version
+        """
+        sources = get_sources(version)
+
+        if sources['model'] is None:
+            raise Exception(f"No version '{version}' available\n")
+
+        blob = zlib.decompress(self._get_pool().submit(build_version, version, sources, self.snapshot_dir).result())
+
+        return loads(blob, version) + (len(blob),)
+
+    async def prepare(self, version, rebuild=False):
+        """
+        loads a version off the event loop without making it resident, so requests keep getting
+        whatever they got before until it is published
+
+        :param version: the biolink model version, not an alias
+        :param rebuild: build it again from its sources, ignoring any snapshot
+        :return: the data, the uri map and the approximate size of the version
+        """
+        start = time.perf_counter()
+        loaded = await asyncio.get_running_loop().run_in_executor(None, self._build if rebuild else self._load, version)
+        self._timed(version, start)
+
+        return loaded
+
+    async def reload(self, version):
+        """
+        builds a version again from its sources, ignoring any snapshot, and swaps it in.
+        until then requests keep getting the old copy
+
+        :param version: the biolink model version, not an alias
+        """
+        self.publish(self.available, self.aliases, {version: await self.prepare(version, rebuild=True)})
+
+    def publish(self, available, aliases, loaded):
+        """
+        swaps in a new set of versions in one step on the event loop, so no request sees part of
+        the old set and part of the new one
+
+        :param available: the versions that may be served, None for all
+        :param aliases: a dict of alias to the version it is the same as
+        :param loaded: a dict of version to the data, uri map and size to make resident, replacing any copy there is
+        """
+        self.available = available
+        self.set_aliases(aliases)
+
+        for version in [version for version in self.data if not self.is_available(version)]:
+            self.drop(version)
+
+        for version, (data, uri_map, size) in loaded.items():
+            if not self._withdrawn(version):
+                self.add(version, data, uri_map, size)
+
+    async def acquire(self, version) -> str:
+        """
+        makes sure a version is resident, loading it if needed
+
+        :param version: the biolink model version
+        :return: the version the data is kept under, which differs for an alias
+        """
+        if not self.is_available(version):
+            raise Exception(f"No version '{version}' available\n")
+
+        version = self.resolve(version)
+
+        if version in self.data:
+            self.sizes.move_to_end(version)
+            return version
+
+        # somebody is already loading this one, wait for them
+        task = self._loading.get(version)
+
+        if task is None:
+            task = asyncio.ensure_future(self._acquire(version))
+            self._loading[version] = task
+
+        await asyncio.shield(task)
+
+        return version
+
+    async def _acquire(self, version):
+        try:
+            loop = asyncio.get_running_loop()
+
+            start = time.perf_counter()
+            data, uri_map, size = await loop.run_in_executor(None, self._load, version)
+        except Exception as e:
+            logger.error(f"Failed to load version '{version}': {e!r}")
+            raise Exception(f"No version '{version}' available\n")
+        finally:
+            del self._loading[version]
+
+        if self._withdrawn(version):
+            raise Exception(f"No version '{version}' available\n")
+
+        self._timed(version, start)
+        self.add(version, data, uri_map, size)
+
+    def _withdrawn(self, version) -> bool:
+        """
+        checks a version that just finished loading is still served. a reload may have dropped
+        it or made it an alias in the meantime, and it shouldn't come back
+        """
+        if self.is_available(version) and version not in self.aliases:
+            return False
+
+        logger.info(f"Version '{version}' was withdrawn while it loaded, not keeping it")
+        self.load_seconds.pop(version, None)
+
+        return True
+
+    def _timed(self, version, start):
+        self.load_seconds[version] = seconds = time.perf_counter() - start
+        VERSION_LOAD_SECONDS.observe(seconds, version)
+
+    def add(self, version, data, uri_map, size=0):
+        """
+        makes a loaded version resident
+
+        :param version: the biolink model version
+        :param data: the geneology and raw data
+        :param uri_map: the uri map
+        :param size: the approximate size of the version in bytes
+        """
+        # records another version already holds cost nothing extra
+        data['raw'], reused = self.elements.add(version, data['raw'])
+        size = max(size - reused, 0)
+
+        collisions = data.get('alias_collisions')
+        if collisions:
+            examples = ', '.join(f"'{spelling}' ({' / '.join(keys)})" for spelling, keys in sorted(collisions.items())[:5])
+            logger.warning(f"Version '{version}': {len(collisions)} spellings name more than one element and are not indexed, e.g. {examples}")
+
+        self.data[version], self.uri_maps[version] = data, uri_map
+        self.bodies[version] = dict()
+        self.indexes[version] = dict()
+        self._forget_pairs(version)
+        self.sizes[version] = size
+        self.sizes.move_to_end(version)
+
+        self.evict(keep=version)
+
+    def evict(self, keep=None):
+        """
+        evicts the least recently used versions until the resident set is within its limits
+
+        :param keep: a version that should stay, typically the one just loaded
+        """
+        for version in list(self.sizes):
+            if not self._over_budget():
+                break
+
+            if self.is_pinned(version) or version == keep:
+                continue
+
+            logger.info(f"Evicting version '{version}'")
+
+            self.drop(version)
+
+    def drop(self, version):
+        del self.data[version], self.uri_maps[version], self.sizes[version]
+        self.load_seconds.pop(version, None)
+        self.bodies.pop(version, None)
+        self.indexes.pop(version, None)
+        self._forget_pairs(version)
+        self.elements.remove(version)
+
+    def get_body(self, version, key, make) -> bytes:
+        """
+        gets a response body of a resident version, encoding it the first time it is asked for
+
+        :param version: the biolink model version, not an alias
+        :param key: identifies the response within the version
+        :param make: returns the encoded body. if it raises, nothing is kept
+        :return: a dict of content coding to encoded body
+        """
+        bodies = self.bodies[version]
+
+        if key not in bodies:
+            bodies[key] = make_variants(make())
+
+        return bodies[key]
+
+    def get_index(self, version, name, make):
+        """
+        gets a lookup structure of a resident version, building it the first time it is asked for
+
+        :param version: the biolink model version, not an alias
+        :param name: identifies the structure within the version
+        :param make: called with the data of the version, returns the structure
+        :return: the structure
+        """
+        indexes = self.indexes[version]
+
+        if name not in indexes:
+            indexes[name] = make(self.data[version])
+
+        return indexes[name]
+
+    def get_pair_index(self, first, second, name, make):
+        """
+        gets a structure comparing two versions, building it the first time it is asked for.
+        it is forgotten when either version is loaded again or dropped
+
+        :param first: the biolink model version compared from, not an alias
+        :param second: the biolink model version compared to, not an alias
+        :param name: identifies the structure within the pair
+        :param make: called with no arguments, returns the structure
+        :return: the structure
+        """
+        structures = self.pairs.setdefault((first, second), dict())
+
+        if name not in structures:
+            structures[name] = make()
+
+        return structures[name]
+
+    def _forget_pairs(self, version):
+        for pair in [pair for pair in self.pairs if version in pair]:
+            del self.pairs[pair]
+
+    def get_etag(self, version) -> str:
+        """
+        :param version: the biolink model version, not an alias
+        :return: the ETag shared by the responses of the version, or None
+        """
+        return make_etag(self.data[version].get('digest'))
+
+    def _over_budget(self) -> bool:
+        if self.max_versions is not None and len(self.sizes) > self.max_versions:
+            return True
+
+        return self.max_bytes is not None and sum(self.sizes.values()) > self.max_bytes
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
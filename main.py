@@ -1,4 +1,5 @@
 import argparse
+import os
 import uvicorn
 
 #class App:
@@ -9,15 +10,30 @@ import uvicorn
 parser = argparse.ArgumentParser(description='Start BL lookup server.')
 parser.add_argument('--host', default='0.0.0.0', type=str)
 parser.add_argument('--port', default=8144, type=int)
-parser.add_argument('--model', type=str)
+parser.add_argument('--versions', type=str, help='comma separated versions or glob patterns to serve, e.g. "v3.*,latest"')
+parser.add_argument('--min-version', type=str, help='the oldest numbered version to serve')
+parser.add_argument('--max-versions', type=int, help='the most versions to keep loaded at once')
+parser.add_argument('--max-memory', type=int, help='the approximate size in MB of the versions to keep loaded at once')
+parser.add_argument('--snapshot-dir', type=str, help='directory of precompiled model snapshots')
+parser.add_argument('--cache-dir', type=str, default=os.environ.get('BL_LOOKUP_CACHE_DIR'), help='directory caching the model files downloaded from GitHub')
+parser.add_argument('--offline', action='store_true', default=os.environ.get('BL_LOOKUP_OFFLINE', '').lower() in ('1', 'true', 'yes'), help='only use the cached model files, never the network')
+parser.add_argument('--compress-threshold', type=int, default=1024, help='the smallest response in bytes to keep gzip (and brotli) compressed copies of')
+parser.add_argument('--sparql-timeout', type=float, default=10.0, help='seconds to wait for UberGraph')
+parser.add_argument('--sparql-concurrency', type=int, default=8, help='the most UberGraph queries in flight at once')
+parser.add_argument('--sparql-cache-size', type=int, default=10000, help='the most UberGraph parent lookups to keep')
+parser.add_argument('--sparql-cache-ttl', type=int, default=86400, help='seconds an UberGraph parent lookup is kept')
+parser.add_argument('--ro-hierarchy', type=str, default=os.environ.get('BL_LOOKUP_RO_HIERARCHY'), help='file keeping the RO property hierarchy, fetched from UberGraph if missing. defaults to ro_hierarchy.json in the cache dir')
+parser.add_argument('--workers', type=int, help='number of processes building model versions, defaults to the cpu count')
+parser.add_argument('--reload-interval', type=int, default=os.environ.get('BL_LOOKUP_RELOAD_INTERVAL'), help='seconds between checks for new model releases, never if not given')
+parser.add_argument('--admin-token', type=str, default=os.environ.get('BL_LOOKUP_ADMIN_TOKEN'), help='bearer token for POST /admin/reload, which is disabled without one')
 
-try:
+if __name__ == "__main__":
     args = parser.parse_args()
-except:
-    args = {}
 
-if __name__ == "__main__":
-    uvicorn.run("bl_lookup.server:APP", host=args.host, port=args.port, log_level="info")
+    from bl_lookup import server
+    server.configure(args)
+
+    uvicorn.run(server.APP, host=args.host, port=args.port, log_level="info")
 
 
 #!/usr/bin/env python
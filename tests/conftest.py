@@ -0,0 +1,17 @@
+import pytest
+from bl_lookup import server
+from bl_lookup.versions import VersionManager
+
+
+@pytest.fixture
+def version_manager(monkeypatch):
+    """An empty version manager put in place of the server's, so nothing a test loads is left behind for the others."""
+    manager = VersionManager()
+
+    monkeypatch.setattr(server, 'VERSIONS', manager)
+    monkeypatch.setattr(server, 'biolink_data', manager.data)
+    monkeypatch.setattr(server, 'biolink_uri_maps', manager.uri_maps)
+
+    yield manager
+
+    manager.close()
@@ -0,0 +1,43 @@
+import pytest
+from bl_lookup.bl import build_alias_index
+from bl_lookup.server import get_concept, get_concept_key
+
+RAW = {
+    'geneorgeneproduct': {'name': 'gene or gene product', 'class_uri': 'biolink:GeneOrGeneProduct',
+                          'aliases': ['gene product thing'], 'exact_mappings': ['SIO:010035']},
+    'rnaproduct': {'name': 'RNA product', 'class_uri': 'biolink:RNAProduct', 'aliases': [], 'exact_mappings': ['SIO:010035', 'CHEBI:33697']},
+    'catalyzes': {'name': 'catalyzes', 'slot_uri': 'biolink:catalyzes', 'exact_mappings': ['RO:0002327']},
+    'enables': {'name': 'enables', 'slot_uri': 'biolink:enables', 'aliases': ['catalyzes'], 'exact_mappings': ['RO:0002327']},
+}
+
+
+def test_alias_index():
+    index, collisions = build_alias_index(RAW)
+
+    for spelling in ['geneorgeneproduct', 'gene or gene product', 'gene_or_gene_product', 'GeneOrGeneProduct',
+                     'biolink:GeneOrGeneProduct', 'biolink:gene_or_gene_product',
+                     'https://w3id.org/biolink/vocab/GeneOrGeneProduct', 'gene product thing']:
+        assert index[spelling] == 'geneorgeneproduct'
+
+    # only the first letter of each word is raised
+    assert index['RNAProduct'] == 'rnaproduct'
+    assert index['CHEBI:33697'] == 'rnaproduct'
+
+    # a name beats an alias, and mappings claimed by two elements are left out
+    assert index['catalyzes'] == 'catalyzes'
+    assert collisions == {'SIO:010035': ['geneorgeneproduct', 'rnaproduct'], 'RO:0002327': ['catalyzes', 'enables']}
+    assert 'SIO:010035' not in index
+
+
+def test_get_concept_key():
+    index, _ = build_alias_index(RAW)
+    data = {'raw': RAW, 'aliases': index}
+
+    assert get_concept_key('CHEBI:33697', data) == 'rnaproduct'
+    assert get_concept(' Gene_Or_Gene product', data) is RAW['geneorgeneproduct']
+    assert get_concept_key('BIOLINK:rna_Product', data) == 'rnaproduct'
+
+    # other prefixes are not stripped away
+    for concept in ['SIO:010035', 'FOO:catalyzes', 'nothing']:
+        with pytest.raises(Exception):
+            get_concept(concept, data)
@@ -0,0 +1,70 @@
+from collections import defaultdict
+from bl_lookup.diff import diff_versions, filter_diff
+from bl_lookup.versions import VersionManager
+
+GENEOLOGY = {'association': {'ancestors': [], 'descendants': ['biolink:Association']}}
+
+
+def make_version(raw, mappings):
+    uri_map = defaultdict(list)
+
+    for uri, predicate in mappings.items():
+        uri_map[uri].append({'mapping_type': 'exact', 'mapping': {'predicate': predicate}})
+
+    return {'raw': raw, 'geneology': GENEOLOGY}, uri_map
+
+
+def test_diff():
+    shared = {'name': 'named thing', 'class_uri': 'biolink:NamedThing'}
+    old = make_version({
+        'namedthing': shared,
+        'gene': {'name': 'gene', 'class_uri': 'biolink:Gene', 'is_a': 'named thing', 'mixins': []},
+        'causes': {'name': 'causes', 'slot_uri': 'biolink:causes', 'inverse': 'caused by'},
+        'association': {'name': 'association', 'class_uri': 'biolink:Association'},
+    }, {'RO:0002410': 'causes', 'SIO:000001': 'causes'})
+    new = make_version({
+        'namedthing': shared,
+        'gene': {'name': 'gene', 'class_uri': 'biolink:Gene', 'is_a': 'biological entity'},
+        'causes': {'name': 'causes', 'slot_uri': 'biolink:causes', 'inverse': 'caused by', 'biolink:canonical_predicate': 'True'},
+        'biologicalentity': {'name': 'biological entity', 'class_uri': 'biolink:BiologicalEntity', 'is_a': 'named thing'},
+    }, {'RO:0002410': 'causes', 'SIO:000001': 'named thing', 'RO:0002506': 'causes'})
+
+    diff = diff_versions('v1', *old, 'v2', *new)
+
+    assert diff['added'] == [{'uri': 'biolink:BiologicalEntity', 'name': 'biological entity', 'kinds': ['class']}]
+    assert diff['removed'] == [{'uri': 'biolink:Association', 'name': 'association', 'kinds': ['association', 'class']}]
+
+    # an empty mixins list and a missing one are the same
+    assert diff['changed'] == [
+        {'uri': 'biolink:Gene', 'name': 'gene', 'kinds': ['class'],
+         'changes': {'is_a': {'from': 'named thing', 'to': 'biological entity'}}},
+        {'uri': 'biolink:causes', 'name': 'causes', 'kinds': ['predicate'],
+         'changes': {'canonical': {'from': False, 'to': True}}},
+    ]
+
+    mappings = diff['mappings']
+    assert [change['uri'] for change in mappings['added']] == ['RO:0002506']
+    assert mappings['removed'] == []
+    assert mappings['changed'][0]['uri'] == 'SIO:000001'
+    assert mappings['changed'][0]['kinds'] == ['class', 'predicate']
+
+    predicates = filter_diff(diff, 'predicate')
+    assert predicates['added'] == [] and len(predicates['changed']) == 1
+    assert len(predicates['mappings']['added']) == 1
+
+    assert diff_versions('v1', *old, 'v1', *old)['changed'] == []
+
+
+def test_pairs_are_forgotten():
+    manager = VersionManager()
+    manager.add('v1', {'raw': {}, 'geneology': {}}, {})
+    manager.add('v2', {'raw': {}, 'geneology': {}}, {})
+
+    assert manager.get_pair_index('v1', 'v2', 'diff', lambda: 'first') == 'first'
+    assert manager.get_pair_index('v1', 'v2', 'diff', lambda: 'second') == 'first'
+
+    manager.add('v2', {'raw': {}, 'geneology': {}}, {})
+    assert manager.get_pair_index('v1', 'v2', 'diff', lambda: 'second') == 'second'
+
+    manager.drop('v1')
+    assert manager.pairs == {}
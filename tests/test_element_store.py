@@ -0,0 +1,21 @@
+from bl_lookup.element_store import ElementStore
+
+
+def test_shared_records():
+    store = ElementStore()
+    gene = {'name': 'gene', 'is_a': 'biological entity', 'class_uri': 'biolink:Gene'}
+
+    old, reused = store.add('v1', {'gene': gene, 'causes': {'name': 'causes', 'inverse': None}})
+    assert reused == 0
+
+    # an identical record is shared, a changed one is not
+    new, reused = store.add('v2', {'gene': dict(gene), 'causes': {'name': 'causes', 'inverse': 'caused by'}})
+    assert new['gene'] is old['gene']
+    assert new['causes'] is not old['causes']
+    assert reused == len(store.get_serialized('v2', 'gene')['identity'])
+    assert store.stats() == {'references': 4, 'unique': 3, 'ratio': 4 / 3}
+
+    # records go away with the last version using them
+    store.remove('v1')
+    assert store.stats()['unique'] == 2
+    assert new['gene'] == gene
@@ -0,0 +1,99 @@
+import pytest
+import requests
+from bl_lookup.http_cache import HTTPCache
+
+TAGGED = 'https://raw.githubusercontent.com/biolink/biolink-model/v3.1.2/biolink-model.yaml'
+RELEASES = 'https://api.github.com/repos/biolink/biolink-model/releases/latest'
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeGitHub:
+    def __init__(self):
+        self.calls = []
+        self.down = False
+        self.status = None
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append((url, dict(headers or {})))
+        if self.down:
+            raise requests.ConnectionError('no network')
+        if self.status is not None:
+            return FakeResponse(self.status)
+        if (headers or {}).get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, b'{"tag_name": "v3.1.2"}', {'ETag': '"v1"'})
+
+
+@pytest.fixture
+def github(monkeypatch):
+    fake = FakeGitHub()
+    monkeypatch.setattr(requests, 'get', fake.get)
+    return fake
+
+
+def test_revalidates_with_etag(github, tmp_path):
+    cache = HTTPCache(tmp_path, max_age=0)
+
+    assert cache.fetch(RELEASES) == b'{"tag_name": "v3.1.2"}'
+    assert cache.fetch(RELEASES) == b'{"tag_name": "v3.1.2"}'
+
+    assert github.calls == [(RELEASES, {}), (RELEASES, {'If-None-Match': '"v1"'})]
+
+
+def test_reuses_recent_responses(github, tmp_path):
+    cache = HTTPCache(tmp_path, max_age=60)
+
+    cache.fetch(RELEASES)
+    cache.fetch(RELEASES)
+
+    assert len(github.calls) == 1
+
+
+def test_tagged_files_are_never_revalidated(github, tmp_path):
+    HTTPCache(tmp_path, max_age=0).fetch_path(TAGGED)
+
+    path = HTTPCache(tmp_path, max_age=0).fetch_path(TAGGED)
+
+    assert path.endswith('.yaml')
+    assert len(github.calls) == 1
+
+
+def test_offline(github, tmp_path):
+    HTTPCache(tmp_path).fetch(RELEASES)
+
+    offline = HTTPCache(tmp_path, offline=True, max_age=0)
+
+    assert offline.fetch(RELEASES) == b'{"tag_name": "v3.1.2"}'
+    with pytest.raises(Exception, match='offline'):
+        offline.fetch(TAGGED)
+    assert len(github.calls) == 1
+
+
+def test_serves_stale_copy_when_network_fails(github, tmp_path):
+    cache = HTTPCache(tmp_path, max_age=0)
+    cache.fetch(RELEASES)
+
+    github.down = True
+
+    assert cache.fetch(RELEASES) == b'{"tag_name": "v3.1.2"}'
+    with pytest.raises(requests.ConnectionError):
+        cache.fetch(TAGGED)
+
+
+@pytest.mark.parametrize('status', [403, 429, 500])
+def test_serves_stale_copy_on_error_responses(github, tmp_path, status):
+    cache = HTTPCache(tmp_path, max_age=0)
+    cache.fetch(RELEASES)
+
+    github.status = status
+
+    assert cache.fetch(RELEASES) == b'{"tag_name": "v3.1.2"}'
+    assert len(github.calls) == 2
+    with pytest.raises(Exception, match=f'Response error {status}'):
+        cache.fetch(TAGGED)
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import pathlib
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+# importing the package must stay cheap for tests, CLIs and worker processes
+IMPORT_BUDGET_SECONDS = 2.0
+
+# fail any attempt to use the network during the import
+SCRIPT = """
+import socket, sys, time
+
+def no_network(*args, **kwargs):
+    raise RuntimeError('network used during import')
+
+socket.socket.connect = no_network
+socket.getaddrinfo = no_network
+socket.create_connection = no_network
+
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+
+assert 'bmt' not in sys.modules, 'bmt imported'
+print(elapsed)
+"""
+
+
+def time_import(module, cwd=ROOT):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(ROOT), os.environ.get('PYTHONPATH', '')]))
+    result = subprocess.run([sys.executable, '-c', SCRIPT.format(module=module)],
+                            capture_output=True, text=True, cwd=cwd, env=env)
+    assert result.returncode == 0, result.stderr
+    return float(result.stdout)
+
+
+def test_import_bl():
+    assert time_import('bl_lookup.bl') < IMPORT_BUDGET_SECONDS
+
+
+def test_import_server():
+    assert time_import('bl_lookup.server') < IMPORT_BUDGET_SECONDS
+
+
+def test_import_apidocs(tmp_path):
+    assert time_import('bl_lookup.apidocs', cwd=tmp_path) < IMPORT_BUDGET_SECONDS
+    # the docs are only written when asked for
+    assert list(tmp_path.iterdir()) == []
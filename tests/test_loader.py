@@ -0,0 +1,43 @@
+import pathlib
+import zlib
+from collections import defaultdict
+from bl_lookup import bl, loader
+from bl_lookup.snapshot import loads, read_snapshot
+
+SOURCES = {'model': 'https://example.org/v1/biolink-model.yaml', 'mapping': 'https://example.org/v1/predicate_mapping.yaml'}
+
+
+def fake_generate_bl_map(url=None, version='latest', mapping_url=None):
+    uri_map = defaultdict(list)
+    uri_map['RO:0002506'].append({'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:causes'}})
+    return {'geneology': {}, 'raw': {'causes': {'name': 'causes', 'version': version, 'built_from': [url, mapping_url]}}}, uri_map
+
+
+def test_build_version(monkeypatch, tmp_path):
+    def no_releases():
+        raise AssertionError('the worker should not fetch the list of releases')
+
+    monkeypatch.setattr(bl, 'get_models', no_releases)
+    monkeypatch.setattr('bl_lookup.snapshot.fetch', lambda url: url.encode('utf-8'))
+    monkeypatch.setattr(loader, 'generate_bl_map', fake_generate_bl_map)
+
+    data, uri_map = loads(zlib.decompress(loader.build_version('v1', SOURCES, tmp_path)), 'v1', SOURCES)
+
+    assert data['raw']['causes']['built_from'] == [SOURCES['model'], SOURCES['mapping']]
+    assert uri_map['RO:0002506'][0]['mapping']['predicate'] == 'biolink:causes'
+    assert data['source_digest']
+
+    # the built version was written as a snapshot, so the next start reads it
+    assert read_snapshot(tmp_path, 'v1', SOURCES)[0]['raw']['causes']['version'] == 'v1'
+
+
+def test_generate_bl_map_from_urls(monkeypatch):
+    def no_releases():
+        raise AssertionError('the urls were given, the list of releases is not needed')
+
+    monkeypatch.setattr(bl, 'get_models', no_releases)
+    model = str(pathlib.Path(__file__).parent.joinpath('resources', 'mini-biolink-model.yaml'))
+
+    data, uri_map = bl.generate_bl_map(url=model, version='v3.1.2')
+
+    assert data['raw']['gene']['class_uri'] == 'biolink:Gene'
@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from bl_lookup import server
+from bl_lookup.metrics import Counter, Histogram, Timer, render
+
+
+def test_render():
+    counter = Counter('things_total', 'Things.', ('kind',), register=False)
+    counter.inc('a')
+    counter.inc('a', amount=2)
+    counter.inc('b "quoted"')
+
+    histogram = Histogram('wait_seconds', 'Waits.', ('query', 'outcome'), buckets=(0.1, 1.0), register=False)
+    histogram.observe(0.1, 'q', 'ok')
+    histogram.observe(5.0, 'q', 'ok')
+
+    with pytest.raises(ValueError):
+        with Timer(histogram, 'q'):
+            raise ValueError
+
+    lines = render([counter, histogram]).decode('utf-8').splitlines()
+
+    assert '# TYPE things_total counter' in lines
+    assert 'things_total{kind="a"} 3' in lines
+    assert 'things_total{kind="b \\"quoted\\""} 1' in lines
+
+    # the buckets count everything up to and including their bound
+    assert 'wait_seconds_bucket{query="q",outcome="ok",le="0.1"} 1' in lines
+    assert 'wait_seconds_bucket{query="q",outcome="ok",le="1.0"} 1' in lines
+    assert 'wait_seconds_bucket{query="q",outcome="ok",le="+Inf"} 2' in lines
+    assert 'wait_seconds_sum{query="q",outcome="ok"} 5.1' in lines
+    assert 'wait_seconds_count{query="q",outcome="error"} 1' in lines
+
+
+def test_scrape(version_manager):
+    raw = {'causes': {'name': 'causes', 'slot_uri': 'biolink:causes', 'symmetric': None, 'inverse': None}}
+    uri_map = {'RO:0002410': [{'mapping_type': 'exact', 'mapping': {'predicate': 'causes'}}]}
+    version_manager.available = ['v9']
+    version_manager.add('v9', {'raw': raw, 'geneology': {}}, uri_map, 1234)
+
+    client = TestClient(server.APP)
+    response = client.get('/resolve_predicate', params={'predicate': ['RO:0002410', 'biolink:causes', 'nothing'], 'version': 'v9'})
+    assert response.status_code == 200
+    client.get('/bl/causes', params={'version': 'v9'})
+    client.get('/no/such/path')
+
+    response = client.get('/metrics')
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = response.text
+
+    assert 'bl_lookup_predicate_resolutions_total{outcome="uri_map"}' in text
+    assert 'bl_lookup_predicate_resolutions_total{outcome="concept"}' in text
+    assert 'bl_lookup_predicate_resolutions_total{outcome="related_to"}' in text
+    assert 'bl_lookup_version_requests_total{version="v9"}' in text
+    assert 'bl_lookup_version_size_bytes{version="v9"} 1234' in text
+    assert 'bl_lookup_version_elements{version="v9"} 1' in text
+
+    # requests are labelled by route, not by the path asked for
+    assert 'bl_lookup_requests_total{route="/bl/{concept}",method="GET",status="200"}' in text
+    assert 'route="unmatched",method="GET",status="404"' in text
+    assert 'route="/no/such/path"' not in text
+
+
+def test_mapped_to_related_to_is_counted_as_related_to(version_manager, monkeypatch):
+    monkeypatch.setattr(server.RESOLUTIONS, 'values', {})
+
+    raw = {'relatedto': {'name': 'related to', 'slot_uri': 'biolink:related_to', 'symmetric': True, 'inverse': None}}
+    uri_map = {'RO:0000052': [{'mapping_type': 'exact', 'mapping': {'predicate': 'related to'}}]}
+    version_manager.available = ['v9']
+    version_manager.add('v9', {'raw': raw, 'geneology': {}}, uri_map, 1234)
+
+    response = TestClient(server.APP).get('/resolve_predicate', params={'predicate': 'RO:0000052', 'version': 'v9'})
+
+    assert response.json()['RO:0000052']['predicate'] == 'biolink:related_to'
+    assert server.RESOLUTIONS.values == {('related_to',): 1}
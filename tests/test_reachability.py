@@ -0,0 +1,72 @@
+from bl_lookup.reachability import Reachability, get_is_a_ancestors
+
+RAW = {
+    'namedthing': {'name': 'named thing', 'class_uri': 'biolink:NamedThing'},
+    'biologicalentity': {'name': 'biological entity', 'class_uri': 'biolink:BiologicalEntity', 'is_a': 'named thing'},
+    'gene': {'name': 'gene', 'class_uri': 'biolink:Gene', 'is_a': 'biological entity', 'mixins': ['gene or gene product']},
+    'geneorgeneproduct': {'name': 'gene or gene product', 'class_uri': 'biolink:GeneOrGeneProduct', 'mixin': True},
+    'relatedto': {'name': 'related to', 'slot_uri': 'biolink:related_to'},
+    'regulates': {'name': 'regulates', 'slot_uri': 'biolink:regulates', 'is_a': 'related to'},
+}
+
+GENEOLOGY = {
+    'namedthing': {'ancestors': []},
+    'biologicalentity': {'ancestors': ['biolink:NamedThing']},
+    'gene': {'ancestors': ['biolink:BiologicalEntity', 'biolink:NamedThing', 'biolink:GeneOrGeneProduct', 'biolink:Entity']},
+    'geneorgeneproduct': {'ancestors': []},
+    'relatedto': {'ancestors': []},
+    'regulates': {'ancestors': ['biolink:related_to']},
+}
+
+
+def check(reachability, child, parent):
+    return reachability.is_a(reachability.row(child), reachability.row(parent))
+
+
+def test_with_mixins():
+    reachability = Reachability.from_geneology(RAW, GENEOLOGY)
+
+    assert check(reachability, 'gene', 'gene')
+    assert check(reachability, 'gene', 'namedthing')
+    assert check(reachability, 'gene', 'geneorgeneproduct')
+    assert check(reachability, 'regulates', 'relatedto')
+    assert not check(reachability, 'namedthing', 'gene')
+    assert not check(reachability, 'regulates', 'namedthing')
+
+    # uris of elements that aren't kept are left out
+    assert reachability.row('entity') is None
+
+
+def test_is_a_only():
+    assert get_is_a_ancestors(RAW)['gene'] == ['biologicalentity', 'namedthing']
+
+    reachability = Reachability.from_is_a(RAW)
+
+    assert check(reachability, 'gene', 'namedthing')
+    assert not check(reachability, 'gene', 'geneorgeneproduct')
+
+
+def test_is_a_loop():
+    raw = {'a': {'name': 'a', 'is_a': 'b'}, 'b': {'name': 'b', 'is_a': 'a'}}
+
+    assert get_is_a_ancestors(raw) == {'a': ['b'], 'b': ['a']}
+
+
+def test_lowest_common_ancestors():
+    raw = {**RAW, 'protein': {'name': 'protein', 'class_uri': 'biolink:Protein', 'is_a': 'biological entity',
+                              'mixins': ['gene or gene product']}}
+    geneology = {**GENEOLOGY, 'protein': {'ancestors': ['biolink:BiologicalEntity', 'biolink:NamedThing', 'biolink:GeneOrGeneProduct']}}
+
+    def lca(reachability, *keys):
+        return [reachability.keys[row] for row in reachability.lowest_common_ancestors(reachability.row(key) for key in keys)]
+
+    reachability = Reachability.from_geneology(raw, geneology)
+
+    # both branches are kept, the deeper one first
+    assert lca(reachability, 'gene', 'protein') == ['biologicalentity', 'geneorgeneproduct']
+    assert lca(reachability, 'gene', 'biologicalentity', 'protein') == ['biologicalentity']
+    assert lca(reachability, 'gene') == ['gene']
+    assert lca(reachability, 'gene', 'regulates') == []
+    assert lca(reachability) == []
+
+    assert lca(Reachability.from_is_a(raw), 'gene', 'protein') == ['biologicalentity']
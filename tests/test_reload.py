@@ -0,0 +1,190 @@
+import asyncio
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from bl_lookup import bl, server
+from bl_lookup.snapshot import get_sources
+
+
+def run(coroutine):
+    # asyncio.run would clear the current event loop, which test_service still needs
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def make_data(source_digest=None):
+    data = {'raw': {}, 'geneology': {}}
+    if source_digest is not None:
+        data['source_digest'] = source_digest
+    return data
+
+
+@pytest.fixture
+def releases(version_manager, monkeypatch):
+    """The released versions and the hashes of their files, which the test can change."""
+    manager = version_manager
+    releases = {'v1': 'a', 'v2': 'b'}
+    builds = []
+
+    def build(version):
+        builds.append(version)
+        return make_data(releases[version]), {}, 0
+
+    monkeypatch.setattr(server, 'version_policy', None)
+    monkeypatch.setattr(server, 'refresh_models', lambda: ({version: f'url/{version}' for version in releases}, {}))
+    monkeypatch.setattr(server, 'get_digests', lambda versions: {version: releases[version] for version in versions if version in releases})
+    monkeypatch.setattr(server, 'find_aliases', lambda versions, snapshot_dir=None: {})
+    monkeypatch.setattr(server, 'get_sources', lambda version: {'model': f'url/{version}', 'mapping': None})
+    monkeypatch.setattr(manager, '_build', build)
+
+    manager.available = ['v1', 'v2']
+    manager.add('v1', make_data('a'), {})
+    manager.add('v2', make_data(), {})
+
+    return manager, releases, builds
+
+
+def test_reload(releases):
+    manager, releases, builds = releases
+
+    result = run(server.reload_versions())
+    assert result == {'added': [], 'removed': [], 'rebuilt': [], 'aliases': {}, 'failed': {}}
+
+    # a version that didn't know its sources takes the current ones as its own
+    assert manager.data['v2']['source_digest'] == 'b'
+
+    # a new release, one withdrawn, and one whose files changed
+    del releases['v2']
+    releases.update({'v1': 'c', 'v3': 'd'})
+    old = manager.data['v1']
+
+    result = run(server.reload_versions())
+    assert result == {'added': ['v3'], 'removed': ['v2'], 'rebuilt': ['v1'], 'aliases': {}, 'failed': {}}
+    assert builds == ['v1']
+    assert manager.available == ['v1', 'v3']
+    assert 'v2' not in manager.data
+    assert manager.data['v1'] is not old and manager.data['v1']['source_digest'] == 'c'
+
+
+def test_withdrawn_while_loading(releases, monkeypatch):
+    manager, releases, builds = releases
+    manager.available.append('v3')
+    started, finish = threading.Event(), threading.Event()
+
+    def load(version):
+        started.set()
+        finish.wait(5)
+        return make_data('d'), {}, 0
+
+    monkeypatch.setattr(manager, '_load', load)
+
+    async def go():
+        task = asyncio.ensure_future(manager.acquire('v3'))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+
+        # a reload drops the release while it is still being built
+        manager.available.remove('v3')
+        finish.set()
+
+        with pytest.raises(Exception, match="No version 'v3'"):
+            await task
+
+    run(go())
+    assert 'v3' not in manager.data and 'v3' not in manager.load_seconds
+
+
+def test_admin_reload(releases, monkeypatch):
+    client = TestClient(server.APP)
+
+    monkeypatch.setattr(server, 'args', None)
+    assert client.post('/admin/reload').status_code == 403
+
+    monkeypatch.setattr(server, 'args', type('Args', (), {'admin_token': 'secret'}))
+    assert client.post('/admin/reload', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.post('/admin/reload', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.json()['removed'] == []
+
+
+def test_alias_keeps_old_copy_until_its_new_target_is_built(releases, monkeypatch):
+    manager, releases, builds = releases
+    aliases = {'latest': 'v1'}
+    started, finish = threading.Event(), threading.Event()
+
+    def build(version):
+        builds.append(version)
+        started.set()
+        finish.wait(5)
+        return make_data(releases[version]), {}, 0
+
+    monkeypatch.setattr(server, 'find_aliases', lambda versions, snapshot_dir=None: dict(aliases))
+    monkeypatch.setattr(manager, '_build', build)
+    releases['latest'] = 'a'
+    manager.available.append('latest')
+    manager.set_aliases(aliases)
+
+    async def go():
+        # a new release, which 'latest' now points at
+        releases.update({'v3': 'c', 'latest': 'c'})
+        aliases['latest'] = 'v3'
+
+        reload = asyncio.ensure_future(server.reload_versions())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+
+        # while it builds, 'latest' is still the old release and doesn't wait for anything
+        assert manager.resolve('latest') == 'v1'
+        assert await asyncio.wait_for(manager.acquire('latest'), 0.1) == 'v1'
+
+        finish.set()
+        return await reload
+
+    result = run(go())
+    assert result['added'] == ['v3'] and result['failed'] == {}
+    assert builds == ['v3']
+    assert manager.resolve('latest') == 'v3' and 'v3' in manager.data
+
+
+def test_tagged_sources_are_not_fetched(releases, monkeypatch):
+    manager, releases, builds = releases
+    hashed = []
+
+    def tagged(version):
+        return {'model': f'https://raw.githubusercontent.com/biolink/biolink-model/{version}.0.0/biolink-model.yaml', 'mapping': None}
+
+    monkeypatch.setattr(server, 'get_sources', tagged)
+    monkeypatch.setattr(server, 'get_digests', lambda versions: hashed.extend(versions) or {})
+
+    for version in manager.data:
+        manager.data[version]['sources'] = tagged(version)
+
+    # nothing to do, and nothing fetched to find that out
+    result = run(server.reload_versions())
+    assert result['rebuilt'] == [] and hashed == []
+
+    # a version whose urls moved is rebuilt without hashing anything
+    manager.data['v1']['sources'] = tagged('v0')
+
+    result = run(server.reload_versions())
+    assert result['rebuilt'] == ['v1'] and hashed == []
+
+
+def test_failed_refresh_keeps_releases(monkeypatch):
+    monkeypatch.setattr(bl, 'models', {'v1': 'url/v1'})
+    monkeypatch.setattr(bl, 'mappings', {'v1': 'map/v1'})
+    monkeypatch.setattr(bl, 'models_loaded', True)
+
+    def fetch(*args, **kwargs):
+        raise Exception('rate limited')
+
+    monkeypatch.setattr(bl, 'fetch', fetch)
+
+    with pytest.raises(Exception):
+        bl.refresh_models()
+
+    # the releases known before are still served, without going back to GitHub
+    assert bl.models_loaded
+    assert get_sources('v1') == {'model': 'url/v1', 'mapping': 'map/v1'}
@@ -0,0 +1,141 @@
+import json
+from collections import defaultdict
+import pytest
+from fastapi.testclient import TestClient
+from bl_lookup import responses, snapshot
+from bl_lookup.server import APP
+
+
+@pytest.fixture
+def client(version_manager):
+    # nothing else may be loaded, so a test can't go out to GitHub
+    version_manager.available = ['vtest']
+
+    data = {
+        'geneology': {'gene': {'ancestors': ['biolink:NamedThing', 'biolink:Entity'], 'descendants': ['biolink:Gene']},
+                      'entity': {'ancestors': [], 'descendants': [f'biolink:Thing{i}' for i in range(50)]}},
+        'raw': {'gene': {'name': 'gene', 'class_uri': 'biolink:Gene', 'description': 'a gène'}},
+    }
+    uri_map = defaultdict(list)
+    uri_map['SO:0000704'].append({'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:Gene'}})
+
+    version_manager.add('vtest', *snapshot.loads(snapshot.dumps('vtest', {}, data, uri_map)))
+    return TestClient(APP)
+
+
+def test_etag_and_not_modified(client):
+    for url, expected in [('/bl/gene/lineage', ['biolink:NamedThing', 'biolink:Entity', 'biolink:Gene']),
+                          ('/bl/gene', {'name': 'gene', 'class_uri': 'biolink:Gene', 'description': 'a gène'}),
+                          ('/uri_lookup/SO:0000704', [{'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:Gene'}}])]:
+        response = client.get(url, params={'version': 'vtest'})
+        assert response.status_code == 200
+        assert response.json() == expected
+
+        etag = response.headers['etag']
+        response = client.get(url, params={'version': 'vtest'}, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.content == b''
+
+        response = client.get(url, params={'version': 'vtest'}, headers={'If-None-Match': '"stale"'})
+        assert response.status_code == 200
+
+
+def test_misses_are_not_cached(client, version_manager):
+    assert client.get('/bl/nope/ancestors', params={'version': 'vtest'}).status_code == 404
+    assert client.get('/uri_lookup/GARBAGE:NOTHING', params={'version': 'vtest'}).json() == []
+
+    assert version_manager.bodies['vtest'] == {}
+    assert 'GARBAGE:NOTHING' not in version_manager.uri_maps['vtest']
+
+
+def test_compressed_variants(client, monkeypatch):
+    monkeypatch.setattr(responses, 'compress_threshold', 10)
+    params = {'version': 'vtest'}
+
+    response = client.get('/bl/entity/descendants', params=params, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['etag'].endswith('-gzip"')
+    assert response.json() == [f'biolink:Thing{i}' for i in range(50)]
+
+    etag = response.headers['etag']
+    response = client.get('/bl/entity/descendants', params=params, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # a client that does not take gzip gets the plain body, and the gzip ETag does not match it
+    response = client.get('/bl/entity/descendants', params=params, headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'content-encoding' not in response.headers
+
+
+def test_brotli_variant(client, monkeypatch):
+    brotli = pytest.importorskip('brotli')
+    monkeypatch.setattr(responses, 'compress_threshold', 10)
+
+    response = client.get('/bl/entity/descendants', params={'version': 'vtest'}, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['content-encoding'] == 'br'
+    assert response.headers['etag'].endswith('-br"')
+    # the client decodes brotli bodies when the module is installed
+    assert response.json() == [f'biolink:Thing{i}' for i in range(50)]
+
+    variants = responses.make_variants(responses.encode_json(response.json()))
+    assert json.loads(brotli.decompress(variants['br'])) == response.json()
+
+
+def test_choose_encoding():
+    variants = {'identity': b'x', 'gzip': b'y'}
+
+    assert responses.choose_encoding(variants, None) == 'identity'
+    assert responses.choose_encoding(variants, 'gzip, deflate') == 'gzip'
+    assert responses.choose_encoding(variants, 'gzip;q=0') == 'identity'
+    assert responses.choose_encoding(variants, '*') == 'gzip'
+    assert responses.choose_encoding({'identity': b'x'}, 'gzip') == 'identity'
+
+
+def test_batch(client):
+    items = [
+        {'op': 'lineage', 'concept': 'gene', 'version': 'vtest'},
+        {'op': 'properties', 'concept': 'gene', 'version': 'vtest'},
+        {'op': 'uri_lookup', 'uri': 'SO:0000704', 'version': 'vtest'},
+        {'op': 'ancestors', 'concept': 'nope', 'version': 'vtest'},
+        {'op': 'parents', 'concept': 'gene', 'version': 'vtest'},
+        {'op': 'ancestors', 'concept': 'gene', 'version': 'v0'},
+    ]
+    response = client.post('/bl/batch', json=items)
+    assert response.status_code == 200
+
+    results = response.json()
+    assert results[0] == {'result': ['biolink:NamedThing', 'biolink:Entity', 'biolink:Gene']}
+    assert results[1] == {'result': client.get('/bl/gene', params={'version': 'vtest'}).json()}
+    assert results[2] == {'result': [{'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:Gene'}}]}
+    assert results[3] == {'error': "No 'nope'\n"}
+    assert results[4] == {'error': "Unknown op 'parents'\n"}
+    assert results[5] == {'error': "No version 'v0' available\n"}
+
+
+def test_search(client, version_manager):
+    response = client.get('/search', params={'q': 'GE', 'version': 'vtest'})
+    assert response.json() == [{'name': 'gene', 'uri': 'biolink:Gene', 'kinds': ['class'], 'match': 'gene'}]
+
+    # the index is built once per version
+    assert set(version_manager.indexes['vtest']) == {'search'}
+
+
+def test_is_a(client):
+    params = {'version': 'vtest'}
+
+    assert client.get('/bl/biolink:Gene/is_a/gene', params=params).json() is True
+    assert client.get('/bl/gene/is_a/nope', params=params).status_code == 404
+
+    response = client.post('/bl/is_a', params=params, json=[['gene', 'Gene'], ['gene', 'nope']])
+    assert response.json() == [True, None]
+
+    assert client.post('/bl/is_a', params=params, json=[['gene']]).status_code == 400
+    assert client.post('/bl/is_a', params=params, json={'gene': 'gene'}).status_code == 400
+
+
+def test_lca(client):
+    params = {'version': 'vtest'}
+
+    assert client.get('/bl/lca', params={**params, 'concepts': ['gene', 'biolink:Gene']}).json() == ['biolink:Gene']
+    assert client.get('/bl/lca', params={**params, 'concepts': ['gene', 'nope']}).status_code == 404
+    assert client.get('/bl/lca', params=params).status_code == 400
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import httpx
+from bl_lookup import server
+from bl_lookup.ro_hierarchy import PropertyHierarchy, load_hierarchy
+from bl_lookup.ubergraph import UberGraph
+
+PARENTS = {
+    'RO:0003303': ['RO:0002410', 'RO:0002501'],
+    'RO:0002410': ['RO:0002418'],
+    'RO:0002501': ['RO:0002506'],
+    'RO:0002506': ['RO:0002410'],
+}
+
+
+def run(coroutine):
+    # asyncio.run would clear the current event loop, which test_service still needs
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def bulk_stand_in(calls):
+    """A SPARQL endpoint answering the bulk subPropertyOf query."""
+    def handler(request):
+        calls.append(request.url.params['query'])
+        bindings = [{'child': {'type': 'uri', 'value': f'http://purl.obolibrary.org/obo/{child.replace(":", "_")}'},
+                     'parent': {'type': 'uri', 'value': f'http://purl.obolibrary.org/obo/{parent.replace(":", "_")}'}}
+                    for child, parents in PARENTS.items() for parent in parents]
+        return httpx.Response(200, content=json.dumps({'results': {'bindings': bindings}}))
+    return httpx.MockTransport(handler)
+
+
+def test_find_nearest():
+    hierarchy = PropertyHierarchy(PARENTS)
+
+    # the nearest level wins, then the order the parents are listed in
+    assert hierarchy.find_nearest('RO:0003303', lambda ro: ro in {'RO:0002418', 'RO:0002501'}) == 'RO:0002501'
+    assert hierarchy.find_nearest('RO:0003303', lambda ro: ro in {'RO:0002418', 'RO:0002506'}) == 'RO:0002418'
+    assert hierarchy.find_nearest('RO:0003303', lambda ro: False) is None
+
+
+def test_fetched_once_and_kept(tmp_path):
+    calls = []
+    path = tmp_path.joinpath('ro_hierarchy.json')
+
+    async def go():
+        ug = UberGraph(transport=bulk_stand_in(calls))
+        try:
+            return await load_hierarchy(path, ug), await load_hierarchy(path, ug)
+        finally:
+            await ug.close()
+
+    first, second = run(go())
+
+    assert len(calls) == 1
+    assert first.parents == second.parents == PARENTS
+    # offline with nothing on disk means no hierarchy
+    assert run(load_hierarchy(tmp_path.joinpath('missing.json'), None, offline=True)) is None
+
+
+def test_resolve_uses_local_hierarchy(monkeypatch):
+    monkeypatch.setattr(server, 'ro_hierarchy', PropertyHierarchy(PARENTS))
+    uri_map = {'RO:0002506': [{'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:causes'}}]}
+
+    assert run(server.find_mapped_ro('RO:0003303', uri_map)) == 'RO:0002506'
+    assert run(server.find_mapped_ro('RO:0002418', uri_map)) is None
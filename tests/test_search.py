@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+from bl_lookup.search import SearchIndex
+from bl_lookup.server import APP
+
+RAW = {
+    'gene': {'name': 'gene', 'class_uri': 'biolink:Gene', 'aliases': ['locus']},
+    'geneorgeneproduct': {'name': 'gene or gene product', 'class_uri': 'biolink:GeneOrGeneProduct', 'mixin': True},
+    'association': {'name': 'association', 'class_uri': 'biolink:Association'},
+    'genetogeneassociation': {'name': 'gene to gene association', 'class_uri': 'biolink:GeneToGeneAssociation'},
+    'regulates': {'name': 'regulates', 'slot_uri': 'biolink:regulates'},
+    'interactswith': {'name': 'interacts with', 'slot_uri': 'biolink:interacts_with', 'mixin': True},
+}
+
+GENEOLOGY = {'association': {'ancestors': [], 'descendants': ['biolink:Association', 'biolink:GeneToGeneAssociation']}}
+
+
+def names(results):
+    return [result['name'] for result in results]
+
+
+def test_prefix_then_infix():
+    index = SearchIndex(RAW, GENEOLOGY)
+
+    assert names(index.search('gene')) == ['gene', 'gene or gene product', 'gene to gene association']
+    assert names(index.search('gene', infix=False, limit=2)) == ['gene', 'gene or gene product']
+
+    # uris and aliases match too, and underscores stand for spaces
+    assert index.search('Biolink:Reg') == [{'name': 'regulates', 'uri': 'biolink:regulates', 'kinds': ['predicate'],
+                                            'match': 'biolink:regulates'}]
+    assert names(index.search('LOC')) == ['gene']
+    assert names(index.search('to_gene')) == ['gene to gene association']
+    assert names(index.search('ion')) == ['association', 'gene to gene association']
+    assert index.search('nothing like it') == []
+
+
+def test_kinds():
+    index = SearchIndex(RAW, GENEOLOGY)
+
+    assert names(index.search('a', 'association')) == ['association', 'gene to gene association']
+    assert names(index.search('e', 'mixin')) == ['gene or gene product', 'interacts with']
+    assert names(index.search('e', 'predicate')) == ['regulates', 'interacts with']
+    assert 'gene' in names(index.search('gene', 'class'))
+
+
+def test_bad_arguments():
+    client = TestClient(APP)
+
+    assert client.get('/search', params={'q': 'gene', 'kind': 'slot'}).status_code == 400
+    assert client.get('/search', params={'q': 'gene', 'limit': 0}).status_code == 400
@@ -0,0 +1,95 @@
+from collections import defaultdict
+import pytest
+from bl_lookup import snapshot
+from bl_lookup.util import atomic_write
+
+SOURCES = {'model': 'https://example.org/v1/biolink-model.yaml', 'mapping': None}
+
+
+def make_maps():
+    data = {
+        'geneology': {
+            'namedthing': {'ancestors': ['biolink:Entity'], 'descendants': ['biolink:NamedThing', 'biolink:Gene'],
+                           'lineage': ['biolink:Entity', 'biolink:NamedThing', 'biolink:Gene']}
+        },
+        'raw': {'namedthing': {'name': 'named thing', 'class_uri': 'biolink:NamedThing', 'mixin': None}},
+        'resolution': {'uris': {'RO:0002506': {'predicate': 'biolink:causes', 'label': 'causes', 'inverted': False}}, 'concepts': {}},
+        'aliases': {'namedthing': 'namedthing', 'named thing': 'namedthing', 'biolink:NamedThing': 'namedthing'},
+        'alias_collisions': {}
+    }
+    uri_map = defaultdict(list)
+    uri_map['RO:0002506'].append({'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:causes'}})
+    return data, uri_map
+
+
+def test_round_trip():
+    data, uri_map = make_maps()
+    blob = snapshot.dumps('v1', SOURCES, data, uri_map)
+
+    new_data, new_uri_map = snapshot.loads(blob, 'v1', SOURCES)
+
+    # the payload checksum comes back as the content hash of the version
+    assert len(new_data.pop('digest')) == 64
+    # and the urls it was built from, so a reload can tell when they move
+    assert new_data.pop('sources') == SOURCES
+    assert new_data == data
+    assert new_uri_map == uri_map
+    # unknown uris still come back empty, like the live-built map
+    assert new_uri_map['GARBAGE:NOTHING'] == []
+
+
+def test_source_digest():
+    data, uri_map = make_maps()
+    data['source_digest'] = 'f' * 64
+
+    new_data, _ = snapshot.loads(snapshot.dumps('v1', SOURCES, data, uri_map))
+
+    # it travels in the header, outside the checksummed payload
+    assert new_data['source_digest'] == 'f' * 64
+    assert new_data['digest'] == snapshot.loads(snapshot.dumps('v1', SOURCES, make_maps()[0], uri_map))[0]['digest']
+
+
+def test_rejects_corrupt_and_stale():
+    data, uri_map = make_maps()
+    blob = snapshot.dumps('v1', SOURCES, data, uri_map)
+
+    with pytest.raises(ValueError):
+        snapshot.loads(blob.replace(b'NamedThing', b'NamedThang'), 'v1', SOURCES)
+    with pytest.raises(ValueError):
+        snapshot.loads(blob, 'v2', SOURCES)
+    with pytest.raises(ValueError):
+        snapshot.loads(blob, 'v1', {'model': 'https://example.org/v2/biolink-model.yaml', 'mapping': None})
+
+
+def test_read_write(tmp_path):
+    data, uri_map = make_maps()
+
+    assert snapshot.read_snapshot(tmp_path, 'v1', SOURCES) is None
+
+    path = snapshot.write_snapshot(tmp_path, 'v1', data, uri_map, SOURCES)
+
+    assert path == snapshot.snapshot_path(tmp_path, 'v1')
+    new_data, new_uri_map = snapshot.read_snapshot(tmp_path, 'v1', SOURCES)
+    new_data.pop('digest'), new_data.pop('sources')
+    assert (new_data, new_uri_map) == (data, uri_map)
+    # a snapshot built from another release is stale
+    assert snapshot.read_snapshot(tmp_path, 'v1', {'model': 'other', 'mapping': None}) is None
+
+
+def test_atomic_write(tmp_path, monkeypatch):
+    path = tmp_path.joinpath('nested', 'v1.snapshot')
+
+    atomic_write(path, b'first')
+    atomic_write(path, 'second')
+    assert path.read_bytes() == b'second'
+
+    # a failed write leaves the old file and no temporary one behind
+    def fail(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr('os.replace', fail)
+
+    with pytest.raises(OSError):
+        atomic_write(path, b'third')
+
+    assert path.read_bytes() == b'second'
+    assert [child.name for child in path.parent.iterdir()] == ['v1.snapshot']
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import re
+import httpx
+import pytest
+from bl_lookup import server
+from bl_lookup.ttl_cache import TTLCache
+from fastapi.testclient import TestClient
+from bl_lookup.triplestore import TripleStore
+from bl_lookup.ubergraph import UberGraph
+
+
+def sparql_stand_in(parents, seen):
+    """A SPARQL endpoint answering subPropertyOf queries from a dict of child to parents."""
+    def handler(request):
+        query = request.url.params['query']
+        seen.append(query)
+        bindings = [{'parent': {'type': 'uri', 'value': f'http://purl.obolibrary.org/obo/{parent.replace(":", "_")}'}}
+                    for child, child_parents in parents.items() if f'obo/{child.replace(":", "_")}>' in query
+                    for parent in child_parents]
+        # blank nodes come back too, and should be dropped
+        bindings.append({'parent': {'type': 'bnode', 'value': 't1762439'}})
+        return httpx.Response(200, content=json.dumps({'head': {'vars': ['parent']}, 'results': {'bindings': bindings}}))
+    return httpx.MockTransport(handler)
+
+
+def test_property_parent():
+    seen = []
+    ug = UberGraph(transport=sparql_stand_in({'RO:0002212': ['RO:0002211']}, seen))
+
+    async def go():
+        try:
+            return await asyncio.gather(ug.get_property_parent('RO:0002212'), ug.get_property_parent('RO:0000000'))
+        finally:
+            await ug.close()
+
+    assert asyncio.run(go()) == [['RO:0002211'], []]
+    assert len(seen) == 2 and 'rdfs:subPropertyOf' in seen[0]
+
+
+def test_parent_lookups_are_cached_and_coalesced():
+    seen = []
+    ug = UberGraph(transport=sparql_stand_in({'RO:0002212': ['RO:0002211']}, seen))
+
+    async def go():
+        try:
+            first = await asyncio.gather(*[ug.get_property_parent('RO:0002212') for _ in range(10)])
+            return first + [await ug.get_property_parent('RO:0002212')]
+        finally:
+            await ug.close()
+
+    assert asyncio.run(go()) == [['RO:0002211']] * 11
+    assert len(seen) == 1
+    assert ug.cache_stats()['property_parents'] == {'hits': 1, 'misses': 1, 'coalesced': 9, 'size': 1}
+
+
+def test_pool_of_an_old_event_loop_is_closed():
+    store = TripleStore('http://sparql.example.org', transport=sparql_stand_in({}, []))
+
+    async def go():
+        await store.query('SELECT ?parent WHERE {}', outputs=['parent'])
+        # let the pool of the last loop finish closing
+        await asyncio.sleep(0)
+        return store._client
+
+    first = asyncio.run(go())
+    second = asyncio.run(go())
+
+    assert first.is_closed and not second.is_closed
+    asyncio.run(store.close())
+    assert second.is_closed
+
+def test_ttl_cache_expiry_and_eviction():
+    cache = TTLCache(maxsize=2, ttl=0)
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        if key == 'bad':
+            raise ValueError(key)
+        return key.upper()
+
+    async def go():
+        # nothing outlives a ttl of 0
+        assert await cache.get('a', lambda: fetch('a')) == 'A'
+        assert await cache.get('a', lambda: fetch('a')) == 'A'
+
+        cache.ttl = None
+        for key in ['a', 'b', 'c']:
+            await cache.get(key, lambda: fetch(key))
+        # failures are not kept
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.get('bad', lambda: fetch('bad'))
+
+    asyncio.run(go())
+
+    assert calls == ['a', 'a', 'a', 'b', 'c', 'bad', 'bad']
+    assert list(cache.entries) == ['b', 'c']
+
+
+def values_stand_in(parents, seen):
+    """A SPARQL endpoint answering VALUES subPropertyOf queries from a dict of child to parents."""
+    def handler(request):
+        query = request.url.params['query']
+        seen.append(query)
+        iris = re.search(r'VALUES \?child \{([^}]*)\}', query).group(1).split()
+        bindings = [{'child': {'type': 'uri', 'value': iri[1:-1]},
+                     'parent': {'type': 'uri', 'value': f'http://purl.obolibrary.org/obo/{parent.replace(":", "_")}'}}
+                    for iri in iris for parent in parents.get(iri[1:-1].split('/')[-1].replace('_', ':'), [])]
+        return httpx.Response(200, content=json.dumps({'results': {'bindings': bindings}}))
+    return httpx.MockTransport(handler)
+
+
+def test_batched_parents():
+    seen = []
+    ug = UberGraph(transport=values_stand_in({'RO:0002212': ['RO:0002211'], 'RO:0002213': ['RO:0002211', 'RO:0002334']}, seen))
+
+    async def go():
+        try:
+            first = await ug.get_property_parents(['RO:0002212', 'RO:0002213', 'RO:0000000'])
+            # all cached now, and the single lookups share the cache
+            second = await ug.get_property_parents(['RO:0002213', 'RO:0002212'])
+            return first, second, await ug.get_property_parent('RO:0000000')
+        finally:
+            await ug.close()
+
+    first, second, single = asyncio.run(go())
+
+    assert first == {'RO:0002212': ['RO:0002211'], 'RO:0002213': ['RO:0002211', 'RO:0002334'], 'RO:0000000': []}
+    assert second == {'RO:0002213': ['RO:0002211', 'RO:0002334'], 'RO:0002212': ['RO:0002211']}
+    assert single == []
+    assert len(seen) == 1
+
+
+def test_live_walk_is_one_query_per_level(monkeypatch):
+    seen = []
+    # RO:0000003 and RO:0000004 point back at each other
+    parents = {'RO:0000001': ['RO:0000002', 'RO:0000003'], 'RO:0000002': ['RO:0000003'],
+               'RO:0000003': ['RO:0000004'], 'RO:0000004': ['RO:0000003', 'RO:0000005']}
+    ug = UberGraph(transport=values_stand_in(parents, seen))
+    monkeypatch.setattr(server, 'get_ubergraph', lambda: ug)
+    monkeypatch.setattr(server, 'ro_hierarchy', None)
+
+    mapping = [{'mapping_type': 'exact', 'mapping': {'predicate': 'biolink:causes'}}]
+
+    async def go():
+        try:
+            found = await server.find_mapped_ro('RO:0000001', {'RO:0000005': mapping})
+            not_found = await server.find_mapped_ro('RO:0000001', {})
+            return found, not_found
+        finally:
+            await ug.close()
+
+    assert asyncio.run(go()) == ('RO:0000005', None)
+    # three levels the first time. the second walk only has to ask about RO:0000005, and the cycle ends it
+    assert len(seen) == 4
+
+
+@pytest.mark.parametrize('failure', ['status', 'connect', 'timeout'])
+def test_unreachable_ubergraph_resolves_to_related_to(version_manager, monkeypatch, failure):
+    def handler(request):
+        if failure == 'connect':
+            raise httpx.ConnectError('no network', request=request)
+        if failure == 'timeout':
+            raise httpx.ReadTimeout('too slow', request=request)
+        return httpx.Response(503)
+
+    ug = UberGraph(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(server, 'get_ubergraph', lambda: ug)
+    monkeypatch.setattr(server, 'ro_hierarchy', None)
+
+    raw = {'causes': {'name': 'causes', 'slot_uri': 'biolink:causes', 'symmetric': None, 'inverse': None},
+           'relatedto': {'name': 'related to', 'slot_uri': 'biolink:related_to', 'symmetric': True, 'inverse': None}}
+    uri_map = {'RO:0002410': [{'mapping_type': 'exact', 'mapping': {'predicate': 'causes'}}],
+               'RO:0002093': [{'mapping_type': 'exact', 'mapping': {'predicate': 'related to'}}]}
+    version_manager.available = ['v9']
+    version_manager.add('v9', {'raw': raw, 'geneology': {}}, uri_map)
+
+    response = TestClient(server.APP).get('/resolve_predicate', params={'predicate': ['RO:0002410', 'RO:0009999'], 'version': 'v9'})
+
+    # the predicate that needed UberGraph falls back to related to, the other one is unaffected
+    assert response.status_code == 200
+    assert response.json()['RO:0002410']['predicate'] == 'biolink:causes'
+    assert response.json()['RO:0009999']['predicate'] == 'biolink:related_to'
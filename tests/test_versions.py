@@ -0,0 +1,159 @@
+import asyncio
+import json
+import pytest
+from bl_lookup import server, versions
+from bl_lookup.snapshot import SNAPSHOT_FORMAT, snapshot_path
+from bl_lookup.versions import VersionManager, VersionPolicy, parse_version
+
+
+def test_parse_version():
+    assert parse_version('v3.1.2') == (3, 1, 2)
+    assert parse_version('2.2.3') == (2, 2, 3)
+    assert parse_version('v2.4.2-alpha-qualifiers') == (2, 4, 2)
+    assert parse_version('latest') is None
+
+
+def test_policy():
+    released = ['1.8.2', '2.2.3', 'v3.1.2', 'v3.3.4', 'latest']
+
+    assert VersionPolicy().select(released) == released
+    assert VersionPolicy(['v3.1.2', 'latest']).select(released) == ['v3.1.2', 'latest']
+    assert VersionPolicy(['v3.*']).select(released) == ['v3.1.2', 'v3.3.4']
+    assert VersionPolicy(min_version='2.0.0').select(released) == ['2.2.3', 'v3.1.2', 'v3.3.4', 'latest']
+
+
+class CountingManager(VersionManager):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.loads = []
+
+    def _load(self, version):
+        self.loads.append(version)
+        if version == 'broken':
+            raise Exception('Github API response error.')
+        return {'raw': {}, 'geneology': {}}, {}, 100
+
+
+def test_concurrent_requests_share_one_load():
+    manager = CountingManager()
+
+    async def go():
+        await asyncio.gather(*[manager.acquire('v3.1.2') for _ in range(10)])
+
+    asyncio.run(go())
+
+    assert manager.loads == ['v3.1.2']
+    assert 'v3.1.2' in manager.data
+
+
+def test_lru_eviction():
+    manager = CountingManager(max_versions=3, pinned=['latest'])
+
+    async def go():
+        for version in ['latest', 'v1', 'v2', 'v1', 'v3']:
+            await manager.acquire(version)
+
+    asyncio.run(go())
+
+    # v2 was the least recently used unpinned version
+    assert set(manager.data) == {'latest', 'v1', 'v3'}
+    assert manager.loads == ['latest', 'v1', 'v2', 'v3']
+
+
+def test_memory_budget():
+    manager = CountingManager(max_bytes=250)
+
+    async def go():
+        for version in ['v1', 'v2', 'v3']:
+            await manager.acquire(version)
+
+    asyncio.run(go())
+
+    assert list(manager.data) == ['v2', 'v3']
+
+
+def test_unavailable_versions():
+    manager = CountingManager()
+    manager.available = ['v1', 'broken']
+
+    with pytest.raises(Exception, match="No version 'v2' available"):
+        asyncio.run(manager.acquire('v2'))
+    with pytest.raises(Exception, match="No version 'broken' available"):
+        asyncio.run(manager.acquire('broken'))
+
+    assert manager.loads == ['broken']
+
+
+def test_preload_reports_errors_per_version(monkeypatch, caplog):
+    manager = CountingManager(pinned=['v1', 'broken', 'v2'])
+    monkeypatch.setattr(server, 'VERSIONS', manager)
+
+    failed = asyncio.run(server.preload_versions(['v1', 'broken', 'v2', 'v3']))
+
+    # the broken version is reported on its own, and the other pinned ones still load
+    assert list(failed) == ['broken']
+    assert "Version 'broken' is not available" in caplog.text
+    assert set(manager.data) == {'v1', 'v2'}
+    assert sorted(manager.loads) == ['broken', 'v1', 'v2']
+
+
+def test_find_aliases(monkeypatch, tmp_path):
+    sources = {
+        'v3.1.2': {'model': 'v3.1.2/model.yaml', 'mapping': 'v3.1.2/mapping.yaml'},
+        'v4.0.0': {'model': 'v4.0.0/model.yaml', 'mapping': 'v4.0.0/mapping.yaml'},
+        'latest': {'model': 'v4.0.0/model.yaml', 'mapping': 'latest/mapping.yaml'},
+        'v4.0.0-copy': {'model': 'v4.0.0/model.yaml', 'mapping': 'v4.0.0/mapping.yaml'},
+    }
+    hashed = []
+
+    def get_source_digest(version, sources=None):
+        hashed.append(version)
+        return 'same'
+
+    monkeypatch.setattr(versions, 'get_sources', lambda version: sources[version])
+    monkeypatch.setattr(versions, 'get_source_digest', get_source_digest)
+
+    # the same urls need no fetching, and a release with its own model url is never hashed
+    assert versions.find_aliases(['v3.1.2', 'v4.0.0', 'v4.0.0-copy']) == {'v4.0.0-copy': 'v4.0.0'}
+    assert hashed == []
+
+    # the mapping urls differ, so the files are hashed once per set of urls
+    assert versions.find_aliases(['latest', 'v3.1.2', 'v4.0.0', 'v4.0.0-copy']) == {'latest': 'v4.0.0', 'v4.0.0-copy': 'v4.0.0'}
+    assert sorted(hashed) == ['latest', 'v4.0.0']
+
+    # a current snapshot header has the digest, so nothing is fetched
+    hashed.clear()
+    snapshot_dir = tmp_path
+
+    for version, digest in [('latest', 'same'), ('v4.0.0', 'same')]:
+        header = {'format': SNAPSHOT_FORMAT, 'version': version, 'sources': sources[version], 'source_digest': digest}
+        snapshot_path(snapshot_dir, version).write_bytes(json.dumps(header).encode('utf-8') + b'\n{}')
+
+    assert versions.find_aliases(['latest', 'v4.0.0'], snapshot_dir) == {'latest': 'v4.0.0'}
+    assert hashed == []
+
+    # unless it was built from other urls
+    sources['latest'] = {'model': 'v4.0.0/model.yaml', 'mapping': 'moved/mapping.yaml'}
+
+    assert versions.find_aliases(['latest', 'v4.0.0'], snapshot_dir) == {'latest': 'v4.0.0'}
+    assert hashed == ['latest']
+
+
+def test_aliases_share_one_load():
+    manager = CountingManager(max_versions=1, pinned=['latest'])
+    manager.set_aliases({'latest': 'v4.0.0'})
+
+    async def go():
+        return await asyncio.gather(manager.acquire('latest'), manager.acquire('v4.0.0'))
+
+    assert asyncio.run(go()) == ['v4.0.0', 'v4.0.0']
+    assert manager.loads == ['v4.0.0']
+
+    # the target of a pinned alias is pinned too
+    asyncio.run(manager.acquire('v1'))
+    assert set(manager.data) == {'v4.0.0', 'v1'}
+
+    # re-pointing the alias leaves the old target to be evicted like any other version
+    manager.set_aliases({'latest': 'v1'})
+    asyncio.run(manager.acquire('v2'))
+    assert set(manager.data) == {'v1', 'v2'}